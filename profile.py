@@ -1,14 +1,16 @@
 import cProfile
 from pstats import Stats
 import time
+import resource
 
 import os,sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import sc2reader
+from sc2reader.config import DefaultConfig, SummaryConfig, IntegrationConfig
 
 skipnames = ('empty','footman')
 
-def parse_replays():
+def parse_replays(config=DefaultConfig()):
     # Run four times to dampen noise
     for run in range(1,4):
         file_list = []
@@ -21,7 +23,7 @@ def parse_replays():
 
         for file in file_list:
             print file
-            replay = sc2reader.read(file)
+            replay = sc2reader.read(file,config)
 
 # Use the results of this function when comparing performance with other libraries.
 def benchmark_with_timetime():
@@ -30,6 +32,42 @@ def benchmark_with_timetime():
     diff = time.time() - start
     print diff
 
+# SummaryConfig should come in at least an order of magnitude under DefaultConfig
+def benchmark_configs():
+    for config in (DefaultConfig(), SummaryConfig()):
+        start = time.time()
+        parse_replays(config)
+        print "%s: %s" % (config.__class__.__name__, time.time() - start)
+
+# Peak memory of holding every parsed event; run in a fresh interpreter
+def benchmark_memory():
+    rootdir = "test_replays/build17811/"
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    replays = [sc2reader.read(os.path.join(rootdir,file),IntegrationConfig())
+                    for file in sorted(os.listdir(rootdir))
+                    if os.path.splitext(file)[0] not in skipnames and file.lower().endswith(".sc2replay")]
+    used = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)*1024
+    events = sum(len(replay.events) for replay in replays)
+    print "%s events: %s MB, %s bytes/event" % (events, used/2**20, used/events)
+
+# Wall and cpu seconds of each stage of reading, summed over the replays
+def benchmark_stages():
+    from collections import defaultdict
+    class StatsConfig(DefaultConfig):
+        stats = True
+
+    rootdir = "test_replays/build17811/"
+    totals = defaultdict(lambda: defaultdict(float))
+    for file in sorted(os.listdir(rootdir)):
+        if os.path.splitext(file)[0] not in skipnames and file.lower().endswith(".sc2replay"):
+            replay = sc2reader.read(os.path.join(rootdir,file),StatsConfig())
+            for name, record in replay.stats.stages:
+                for field, value in record.iteritems():
+                    totals[name][field] += value
+
+    for name, record in sorted(totals.iteritems(), key=lambda item: -item[1]['wall']):
+        print "%-60s %6.3fs wall %6.3fs cpu %9d bytes %7d objects" % (name, record['wall'], record['cpu'], record['bytes'], record['objects'])
+
 def profile():
     cProfile.run("parse_replays()","replay_profile")
     stats = Stats("replay_profile")
@@ -37,4 +75,7 @@ def profile():
 
 
 #benchmark_with_timetime()
+#benchmark_configs()
+#benchmark_memory()
+#benchmark_stages()
 profile()
@@ -1,63 +1,225 @@
 import os
+import struct
+import traceback
+from cStringIO import StringIO
+from collections import deque
+from multiprocessing import Pool, cpu_count
 
-from mpyq import MPQArchive
-from config import DefaultConfig
-from utils import ReplayBuffer, LITTLE_ENDIAN
+from cache import ReplayCache
+from config import DefaultConfig, project
+from exceptions import ReadError
+from processors import process_events, process_stream
+from store import EventStore
+from utils import LazyLoader, ReadStats, ReplayArchive, ReplayBuffer, is_filename, null_stage
 
 def read_header(file):
-    buffer = ReplayBuffer(file)
-    
+    """ Reads the release and frames from the MPQ user data header of a
+        replay file object, filename or replay contents (see read_file).
+        Only the header bytes are read. """
+    if is_filename(file):
+        with open(file,'rb') as replay_file:
+            return read_header(replay_file)
+    elif not hasattr(file,'read'):
+        file = StringIO(file)
+
     #Check the file type for the MPQ header bytes
-    if buffer.read_hex(4).upper() != "4D50511B":
-        print "Header Hex was: %s" % buffer.read_hex(4).upper()
-        raise ValueError("File '%s' is not an MPQ file" % file.name)
+    header = file.read(16)
+    if len(header) != 16 or header[:4] != 'MPQ\x1b':
+        raise ValueError("File '%s' is not an MPQ file" % getattr(file,'name',file))
     
     #Extract replay header data, we don't actually use this for anything
-    max_data_size = buffer.read_int(LITTLE_ENDIAN) #possibly data max size
-    header_offset = buffer.read_int(LITTLE_ENDIAN) #Offset of the second header
-    data_size = buffer.read_int(LITTLE_ENDIAN)     #possibly data size
+    max_data_size, header_offset, data_size = struct.unpack('<3I',header[4:])
     
     #Extract replay attributes from the mpq
-    data = buffer.read_data_struct()
+    data = ReplayBuffer(file.read(data_size)).read_data_struct()
     
     #return the release and frames information
     return data[1],data[3]
     
-def read(location,config=DefaultConfig()):
+def read(location,config=DefaultConfig(),processes=1):
+    """ Reads a single replay file or, given a directory, every replay file
+        below it. See read_batch for directory results and processes. """
+    if not is_filename(location):
+        return read_file(location,config)
+
     if not os.path.exists(location):
         raise ValueError("Location must exist")
     
     if os.path.isdir(location):
-        replays = list()
-        for location in os.list_files(location):
-            replays.extend(read(location,config))
-        return replays
+        return read_batch(list_files(location),config,processes)
     else:
         return read_file(location,config)
+
+def list_files(location):
+    """ Sorted paths of all SC2Replay files below the location directory """
+    filenames = list()
+    for root, directories, files in os.walk(location):
+        for name in files:
+            if os.path.splitext(name)[1].lower() == '.sc2replay':
+                filenames.append(os.path.join(root,name))
+    return sorted(filenames)
+
+def read_batch(filenames,config=DefaultConfig(),processes=1):
+    """ Reads each of the filenames, in order, across a pool of worker
+        processes. processes=None uses one worker per cpu and processes=1
+        reads in the current process without a pool.
+
+        Failures don't abort the batch; the result list holds a ReadError
+        in place of each replay that couldn't be read.
+    """
+    return list(iread(filenames,config,processes))
+
+def iread(paths,config=DefaultConfig(),processes=1):
+    """ Generator version of read_batch. Accepts a file, a directory or a
+        list of either and yields each replay (or ReadError) in order as
+        soon as it has been parsed.
+
+        No references are kept to yielded replays and at most one replay
+        per worker process is held back waiting to be yielded so memory
+        use doesn't grow with the number of files read.
+    """
+    if isinstance(paths,basestring):
+        paths = [paths]
+    jobs = ((filename,config) for filename in _expand_paths(paths))
+
+    if processes == 1:
+        for job in jobs:
+            yield _read_job(job)
+        return
+
+    workers = processes or cpu_count()
+    pool = Pool(workers)
+    try:
+        pending = deque()
+        for job in jobs:
+            pending.append(pool.apply_async(_read_job,(job,)))
+            if len(pending) >= workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def _expand_paths(paths):
+    for path in paths:
+        if is_filename(path) and os.path.isdir(path):
+            for filename in list_files(path):
+                yield filename
+        else:
+            yield path
+
+def _read_job(job):
+    # Module level so that it can be dispatched to pool workers
+    filename, config = job
+    try:
+        return read_file(filename,config)
+    except Exception as e:
+        return ReadError(filename,"%s: %s" % (e.__class__.__name__,e),traceback.format_exc())
     
-def read_file(filename,config=DefaultConfig()):
-    if(os.path.splitext(filename)[1].lower() != '.sc2replay'):
-        raise TypeError("Target file must of the SC2Replay file extension")
+def read_file(location,config=DefaultConfig()):
+    """ Reads a replay from a filename, a seekable file-like object or the
+        replay contents as a string, bytearray, buffer or memoryview.
+        In-memory replays are read in place without temp files or copies
+        and have a filename of None. """
+    if config.lazy:
+        return _read_lazy(location,config)
+
+    elif hasattr(location,'read'):
+        return _read_source(getattr(location,'name',None),location,None,config)
+
+    elif is_filename(location):
+        if(os.path.splitext(location)[1].lower() != '.sc2replay'):
+            raise TypeError("Target file must of the SC2Replay file extension")
+
+        with open(location,'rb') as replay_file:
+            return _read_source(location,replay_file,None,config)
+
+    else:
+        return _read_source(None,None,location,config)
+
+def _read_lazy(location,config):
+    if hasattr(location,'read'):
+        location.seek(0)
+        filename = getattr(location,'name',None)
+    elif is_filename(location):
+        if(os.path.splitext(location)[1].lower() != '.sc2replay'):
+            raise TypeError("Target file must of the SC2Replay file extension")
+        filename = location
+    else:
+        filename = None
+
+    release,frames = read_header(location)
+    replay = config.ReplayClass(filename,release,frames)
+    replay.max_frame = config.max_frame
+    replay._loader = LazyLoader(replay,location,config)
+    return replay
+
+def _read_source(filename,replay_file,contents,config):
+    if replay_file is not None:
+        replay_file.seek(0)
+
+    if config.cache is not None:
+        if contents is None:
+            contents = replay_file.read()
+
+        #Cache hits skip the archive, readers and processors entirely
+        key = config.cache.key(contents,__version__,config)
+        replay = config.cache.get(key)
+        if replay is not None:
+            replay.filename = filename
+            return replay
+
+    if contents is not None:
+        replay_file = StringIO(contents)
+
+    replay = _read_replay(filename,replay_file,config)
+    if config.cache is not None:
+        config.cache.set(key,replay)
+    return replay
+
+def _read_replay(filename,replay_file,config):
+    release,frames = read_header(replay_file)
+    replay = config.ReplayClass(filename,release,frames)
+    replay.max_frame = config.max_frame
+
+    stats = None
+    if config.stats:
+        stats = replay.stats = ReadStats(config.stats_hooks)
+    stage = null_stage if stats is None else stats.stage
+
+    with stage('archive',replay):
+        archive = ReplayArchive(replay_file)
     
-    with open(filename) as replay_file:
-        release,frames = read_header(replay_file)
-        replay = config.ReplayClass(filename,release,frames)
-        archive = MPQArchive(filename,listfile=False)
-        
-        #Extract and Parse the relevant files
-        for file,readers in config.readers.iteritems():
-            for reader in readers:
-                if reader.reads(replay.build):
-                    reader.read(ReplayBuffer(archive.read_file(file)),replay)
-                    break
+    #Extract and Parse the relevant files, sharing the archive with readers
+    plan = config.plan_for(replay.build)
+    replay.archive = archive
+    for file,reader in plan.readers:
+        if stats is not None and file not in archive.members:
+            with stage('decompress %s' % file,replay,archive.archived_size(file)):
+                archive.read_file(file)
+
+        buffer = ReplayBuffer(archive.read_file(file))
+        with stage('read %s' % file,replay,buffer.length):
+            if (config.stream_events or config.event_store) and hasattr(reader,'stream'):
+                replay.events = reader.stream(buffer,replay)
             else:
-                raise NotYetImplementedError("No parser was found that accepted the replay file;check configuration")
+                reader.read(buffer,replay)
+    del replay.archive
+    replay.archive_stats = archive.stats
 
-        #Do cleanup and post processing
-        for processor in config.processors:
-            replay = processor.process(replay)
-            
-        return replay
+    #Do cleanup and post processing
+    if config.event_store:
+        replay = process_stream(replay,plan.processors,EventStore(),stats)
+    elif config.stream_events:
+        replay = process_stream(replay,plan.processors,None,stats)
+    else:
+        replay = process_events(replay,plan.processors,None,stats)
+        
+    return replay
         
-__all__ = [DefaultConfig,read,read_file]
+__all__ = [DefaultConfig,ReadError,ReplayCache,project,read,read_batch,iread,read_file,read_header]
 __version__ = "0.1.0"
@@ -0,0 +1,110 @@
+import os
+import zlib
+import cPickle
+import hashlib
+import tempfile
+
+class ReplayCache(object):
+    """ Content addressed on-disk store of parsed replays. Entries are keyed
+        by a hash of the replay file contents, the sc2reader version and the
+        Config class so that any of these changing results in a miss.
+
+        Entries are written to a temporary file and renamed into place so
+        that any number of worker processes can share one cache directory.
+        Once the directory grows over max_size bytes the least recently
+        used entries are removed.
+
+        Enable it by setting the cache attribute of a Config::
+
+            class CachedConfig(DefaultConfig):
+                cache = ReplayCache('/var/cache/sc2reader')
+    """
+
+    def __init__(self, directory, max_size=2**30):
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                #Someone else created it first
+                if not os.path.isdir(directory): raise
+
+    def key(self, data, version, config):
+        digest = hashlib.sha1(data)
+        digest.update(version)
+        digest.update(getattr(config, 'cache_name', "%s.%s" % (config.__class__.__module__, config.__class__.__name__)))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """ Returns the cached replay or None on a miss """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as entry:
+                data = entry.read()
+        except IOError:
+            return None
+
+        try:
+            replay = cPickle.loads(zlib.decompress(data))
+        except Exception:
+            #Written by an incompatible version, drop it
+            self._remove(path)
+            return None
+
+        #Mark as recently used for the eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return replay
+
+    def set(self, key, replay):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory): raise
+
+        data = zlib.compress(cPickle.dumps(replay, cPickle.HIGHEST_PROTOCOL), 1)
+        handle, temp = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as entry:
+                entry.write(data)
+            os.rename(temp, path)
+        except OSError:
+            #Windows won't rename over an existing entry; keep that one
+            self._remove(temp)
+
+        self.evict()
+
+    def evict(self):
+        """ Removes least recently used entries until under max_size """
+        entries, size = list(), 0
+        for root, directories, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith('.tmp'): continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                size += stat.st_size
+
+        for mtime, entry_size, path in sorted(entries):
+            if size <= self.max_size: break
+            self._remove(path)
+            size -= entry_size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            #Already removed by another process
+            pass
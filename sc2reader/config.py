@@ -6,7 +6,10 @@ except ImportError:
     from sys import exit
     exit("OrderedDict required: Upgrade to python2.7 or `pip install ordereddict`")
 
-from sc2reader.objects import Replay
+from bisect import bisect_right
+from sys import maxint
+
+from sc2reader.objects import Replay, Summary
 from sc2reader.processors import *
 from sc2reader.readers import *
 from sc2reader.utils import key_in_bases
@@ -31,6 +34,105 @@ class MetaConfig(type):
 class Config(object):
     __metaclass__ = MetaConfig
 
+    # Optional sc2reader.cache.ReplayCache for parsed replays
+    cache = None
+
+    # Parse sections of the replay on first access, see utils.LazyLoader.
+    # Lazy replays keep a reference to their source and are never cached.
+    lazy = False
+
+    # Feed game events to processors with on_event hooks as they are parsed
+    # instead of building replay.events; see processors.process_stream.
+    # Event lists on the replay and its people are left empty. Lazy replays
+    # always read the full event list.
+    stream_events = False
+
+    # Keep replay.events as a columnar sc2reader.store.EventStore filled while
+    # streaming the events to processors. Implies stream_events.
+    event_store = False
+
+    # Stop reading game events after this frame (16 per game second). The
+    # replay.max_frame is set and results are only known from earlier events.
+    max_frame = None
+
+    # Record the wall time, cpu time, bytes and objects of each stage of
+    # reading as replay.stats, see utils.ReadStats. Each of the stats_hooks
+    # is called with the stage name and its record as the stage finishes.
+    stats = False
+    stats_hooks = []
+
+    def plan_for(self, build):
+        """ Returns the BuildPlan for reading replays of the build """
+        if '_plans' not in self.__dict__:
+            self._plans = BuildPlans(self)
+        return self._plans.get(build)
+
+    def __getstate__(self):
+        #Plans are compiled again where the config is used
+        state = self.__dict__.copy()
+        state.pop('_plans', None)
+        return state
+
+class BuildPlan(object):
+    """ The (file, reader) pairs to read in order and the processors to run
+        for replays of a range of builds """
+    def __init__(self, readers, processors):
+        self.readers = readers
+        self.processors = processors
+
+class BuildPlans(object):
+    """ Compiled BuildPlans of a config. The readers are picked once for
+        each range of builds in which every reader's builds range gives the
+        same answer, and plans are found by bisecting the starts of those
+        ranges. Readers overriding reads are asked about each build, making
+        the plan only good for that build. """
+
+    def __init__(self, config):
+        self.config = config
+        self.starts, self.ranges = list(), list()
+        self.builds = dict()
+
+    def get(self, build):
+        if build in self.builds:
+            return self.builds[build]
+
+        index = bisect_right(self.starts, build)-1
+        if index >= 0 and build < self.ranges[index][0]:
+            return self.ranges[index][1]
+
+        return self.compile(build)
+
+    def compile(self, build):
+        start, end, exact = 0, maxint, False
+        readers = list()
+        for file, candidates in self.config.readers.iteritems():
+            for reader in candidates:
+                if reader.__class__.reads.im_func is not Reader.reads.im_func:
+                    exact = True
+                    if reader.reads(build): break
+                    continue
+
+                first, last = reader.builds
+                if first <= build < last:
+                    start, end = max(start, first), min(end, last)
+                    break
+                elif build < first:
+                    end = min(end, first)
+                else:
+                    start = max(start, last)
+            else:
+                raise NotImplementedError("No reader for %s accepts build %s; check the configuration" % (file, build))
+            readers.append((file, reader))
+
+        plan = BuildPlan(readers, list(self.config.processors))
+        if exact:
+            self.builds[build] = plan
+        else:
+            index = bisect_right(self.starts, start)
+            self.starts.insert(index, start)
+            self.ranges.insert(index, (end, plan))
+        return plan
+
 #####################################################
 
 class DefaultConfig(Config):
@@ -79,6 +181,26 @@ class NoEventsConfig(DefaultConfig):
 
 #########################################################
 
+class SummaryConfig(Config):
+    """ Metadata only: map, players, teams and dates. The replay.message.events
+        and replay.game.events files are never extracted or decompressed so
+        results, messages and events aren't available. """
+    ReplayClass = Summary
+
+    readers = OrderedDict([
+            ('replay.initData', [ReplayInitDataReader()]),
+            ('replay.details', [ReplayDetailsReader()]),
+            ('replay.attributes.events', [AttributeEventsReader_17326(), AttributeEventsReader()]),
+        ])
+
+    processors = [
+            PeopleProcessor(),
+            AttributeProcessor(),
+            TeamsProcessor(),
+        ]
+
+#########################################################
+
 class IntegrationConfig(Config):
     ReplayClass = Replay
     readers = OrderedDict([
@@ -90,3 +212,103 @@ class IntegrationConfig(Config):
         ])
         
     processors = []
+
+#########################################################
+
+class ProjectedConfig(Config):
+    """ The readers and processors of a config needed for a set of replay
+        fields, see project. Every other option is taken from the config. """
+    ReplayClass = Replay
+    readers = OrderedDict()
+    processors = []
+
+    def __init__(self, config, fields, readers, processors):
+        for name in dir(Config)+['ReplayClass']:
+            if not name.startswith('_') and not callable(getattr(Config, name, None)):
+                setattr(self, name, getattr(config, name))
+        self.config, self.fields = config, fields
+        self.readers, self.processors = readers, processors
+
+        #Replays read with different fields mustn't share cache entries
+        self.cache_name = "%s.%s%s" % (config.__class__.__module__, config.__class__.__name__, list(fields))
+
+    def __reduce__(self):
+        #Sent to worker processes as the projection, planned again there
+        return (project, (self.fields, self.config))
+
+_plans = dict()
+
+def project(fields, config=DefaultConfig()):
+    """ Returns a ProjectedConfig with only the readers and processors of
+        config needed to provide the fields, and those they require. Only
+        the archive members of those readers are decompressed::
+
+            config = sc2reader.project(['map', 'players[*].result', 'players[*].avg_apm'])
+            replay = sc2reader.read('my.SC2Replay', config)
+
+        Fields are replay attributes, optionally followed by [*] and the
+        attribute of each item. These are found in the provides lists of the
+        readers and processors, falling back to the replay attribute for
+        item attributes nobody provides. Fields set from the replay header
+        need no readers. The plan is made once for each Config class and set
+        of fields. """
+    fields = tuple(sorted(set(fields)))
+    key = (config.__class__, fields)
+    if key not in _plans:
+        _plans[key] = plan(config, fields)
+    return ProjectedConfig(config, fields, *_plans[key])
+
+def plan(config, fields):
+    """ Returns the readers and processors of config needed for the fields
+        in their order in config; see project """
+    providers = dict()
+    for file, readers in config.readers.iteritems():
+        for reader in readers:
+            for name in reader.provides:
+                providers[name] = file
+    for processor in config.processors:
+        for name in processor.provides:
+            providers[name] = processor
+
+    files, processors = set(), set()
+    def require_file(file, needed_by):
+        if file not in config.readers:
+            raise ValueError("%s requires %s which %s doesn't read" % (needed_by, file, config.__class__.__name__))
+        files.add(file)
+
+    def require_processor(processor):
+        if processor in processors:
+            return
+        processors.add(processor)
+        for file in processor.required_readers:
+            require_file(file, processor.__class__.__name__)
+        for required in processor.required_processors:
+            matches = [other for other in config.processors if isinstance(other, required)]
+            if not matches:
+                raise ValueError("%s requires a %s" % (processor.__class__.__name__, required.__name__))
+            for other in matches:
+                require_processor(other)
+
+    #Fields left to the header are on the replay but no reader or
+    #processor anywhere provides them
+    header = config.ReplayClass(None, '0.0.0.0')
+    elsewhere = set(name for cls in _subclasses(Reader)+_subclasses(Processor) for name in cls.provides)
+    for field in fields:
+        attribute = field.split('[')[0].split('.')[0]
+        provider = providers.get(field, None)
+        if provider is None and field not in elsewhere:
+            provider = providers.get(attribute, None)
+
+        if isinstance(provider, basestring):
+            require_file(provider, field)
+        elif provider is not None:
+            require_processor(provider)
+        elif field in elsewhere or attribute in elsewhere or not hasattr(header, attribute):
+            raise ValueError("Nothing in %s provides %s" % (config.__class__.__name__, field))
+
+    readers = OrderedDict((file, readers) for file, readers in config.readers.iteritems() if file in files)
+    return readers, [processor for processor in config.processors if processor in processors]
+
+def _subclasses(cls):
+    subclasses = cls.__subclasses__()
+    return subclasses+[sub for subclass in subclasses for sub in _subclasses(subclass)]
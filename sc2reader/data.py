@@ -26,6 +26,7 @@ class MetaGameObject(type):
 
             data = {
                 'name': dct.get('name', False) or _uncamel_case(name),
+                '__slots__': (),
             }
             for (key,value) in dct.items():
                 if callable(value):
@@ -81,6 +82,11 @@ class MetaGameObject(type):
                         mode_bases = tuple([mode_base,] + list(value.__bases__))
                         mode = cls.__new__(cls, value.__name__, mode_bases, mode_dct)
 
+                        # Expose the mode at module level so that objects
+                        # which morphed into it can be pickled by reference
+                        mode.__name__ = name + value.__name__
+                        globals()[mode.__name__] = mode
+
                         def _morph_to(self, timestamp):
                             if not is_upgrade: # upgrades cost money, which we can't track
                                 self.morph_to(mode, timestamp)
@@ -111,12 +117,16 @@ class MetaGameObject(type):
             # Register it
             OBJECTTYPE_CODES[code] = kls
         else:
+            #Objects morph between these classes so no slots can be added
+            dct.setdefault('__slots__', ())
             kls = super(MetaGameObject, cls).__new__(cls, name, bases, dct)
 
         return kls
 
 class GameObject(object):
     __metaclass__ = MetaGameObject
+    __slots__ = ('id', 'first_seen', 'last_seen', 'player', 'object_types',
+                 'spell_casts', 'trained', 'built', 'researched')
 
     abilities = {
         0x3700: 'Right click',
@@ -174,41 +184,50 @@ class GameObject(object):
         return '%s (%s)' % (self.name, hex(self.id))
 
 class Terran(object):
+    __slots__ = ()
     race = 'Terran'
 class Protoss(object):
+    __slots__ = ()
     race = 'Protoss'
 class Zerg(object):
+    __slots__ = ()
     race = 'Zerg'
 
 class Moveable(object):
+    __slots__ = ()
     move = {
         0x002400: 'Stop',
         0x002620: 'Follow',
     }
 class Unit(Moveable):
+    __slots__ = ()
     move = {
         0x002610: 'Move to',
         0x002611: 'Patrol',
         0x002602: 'Hold position',
     }
 class Army(object):
+    __slots__ = ()
     move = {
         0x002602: 'Hold position',
         0x002a10: 'Attack move',
         0x002a20: 'Attack object',
     }
 class SpellCaster(object):
+    __slots__ = ()
     move = {
         0x002613: 'Scan move', # attack move for units without attack
         0x002623: 'Scan target', # attack move for units without attack
     }
 
 class Building(object):
+    __slots__ = ()
     abilities = {
         0x013000: 'Cancel build',
         0x013001: 'Halt build',
     }
 class Production(Building):
+    __slots__ = ()
     abilities = {
         0x011710: 'Set rally point',
         0x011720: 'Set rally target',
@@ -218,16 +237,20 @@ class Production(Building):
     }
     pass
 class Main(Building):
+    __slots__ = ()
     pass
 
 #
 # Some useful for stats and other things
 #
 class Worker(Unit):
+    __slots__ = ()
     pass
 class Scout(object):
+    __slots__ = ()
     pass
 class Detector(object):
+    __slots__ = ()
     pass
 
 #
@@ -399,6 +422,7 @@ class PointDefenseDrone(GameObject, Terran):
 
 # Terran Buildings
 class TerranMain(Main):
+    __slots__ = ()
     abilities = {
         0x011910: 'Set rally point',
         0x011920: 'Set rally target',
@@ -600,7 +624,7 @@ class TechlabFactory(GameObject, Building, Terran):
         0x012f00: 'Cancel Research',
         0x012f31: 'Cancel specific Research',
     }
-class Starport(GameObject, Building, Terran):
+class TechlabStarport(GameObject, Building, Terran):
     code = 0x4501
     name = "Techlab (Starport)"
     research = {
@@ -616,13 +640,13 @@ class Starport(GameObject, Building, Terran):
     }
 class Reactor(GameObject, Building, Terran):
     code = 0x1f01
-class Barracks(GameObject, Building, Terran):
+class ReactorBarracks(GameObject, Building, Terran):
     code = 0x4201
     name = "Reactor (Barracks)"
-class Factory(GameObject, Building, Terran):
+class ReactorFactory(GameObject, Building, Terran):
     code = 0x4401
     name = "Reactor (Factory)"
-class Starport(GameObject, Building, Terran):
+class ReactorStarport(GameObject, Building, Terran):
     code = 0x4601
     name = "Reactor (Starport)"
 class FusionCore(GameObject, Building, Terran):
@@ -1022,6 +1046,7 @@ class SporeCrawler(GameObject, Building, Zerg):
         code = 0xa701
 
 class ZergMain(Production, Main):
+    __slots__ = ()
     abilities = {
         0x011b11: 'Set worker rally point',
         0x011b21: 'Set worker rally target',
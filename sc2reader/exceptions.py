@@ -11,4 +11,18 @@ class ParseError(Exception):
             %s""" % (self.message, self.event.type, self.event.code, self.bytes)
         
     def __repr__(self):
-        return str(self)
\ No newline at end of file
+        return str(self)
+
+class ReadError(Exception):
+    """Stands in for a replay that failed to parse during a batch read"""
+    def __init__(self, filename, message, traceback=''):
+        super(ReadError, self).__init__(filename, message, traceback)
+        self.filename = filename
+        self.message = message
+        self.traceback = traceback
+
+    def __str__(self):
+        return "ReadError %s: %s" % (self.filename, self.message)
+
+    def __repr__(self):
+        return str(self)
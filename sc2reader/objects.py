@@ -41,6 +41,12 @@ class Replay(object):
         self.messages = list()
         self.recorder = None # Player object
         self.winner_known = False
+
+        # Last frame of game events read, see Config.max_frame
+        self.max_frame = None
+
+        # Game events that failed to parse in tolerant reads
+        self.diagnostics = list()
         
         # Set in parsers.DetailParser.load, should we hide this?
         self.file_time = None # Probably number milliseconds since EPOCH
@@ -53,8 +59,66 @@ class Replay(object):
         self.utc_date = None # Date when the game was played in UTC
         
         self.objects = {}
+
+        # Set while reading, see utils.ReplayArchive
+        self.archive_stats = dict()
+
+        # Set while reading when the Config enables stats, see utils.ReadStats
+        self.stats = None
+
+    def __getattr__(self, name):
+        # Only called for missing attributes; lazy replays load the section
+        # providing the attribute on first access
+        loader = self.__dict__.get('_loader', None)
+        if loader is None or name.startswith('__') or not loader.load(self, name):
+            raise AttributeError("'%s' object has no attribute '%s'" % (self.__class__.__name__, name))
+        return self.__dict__[name]
+
+class Summary(object):
+    """ Slim, slotted replay container filled from the replay.initData,
+        replay.details and replay.attributes.events files only. See the
+        SummaryConfig for its usage. """
+    __slots__ = (
+            'filename','build','versions','release_string','frames','seconds',
+            'length','player_names','realm','map','file_time','date','utc_date',
+            'attributes','speed','category','is_ladder','is_private','type',
+            'observers','players','people','person','teams','archive',
+            'archive_stats','max_frame','stats',
+        )
+
+    def __init__(self, filename, release, frames=0):
+        if isinstance(release,basestring): release = [None]+release.split('.')
+
+        self.filename = filename
+        self.build = release[4]
+        self.versions = (release[1], release[2], release[3], release[4])
+        self.release_string = "%s.%s.%s.%s" % self.versions
+        self.frames, self.seconds = (frames, frames/16)
+        self.length = (self.seconds/60, self.seconds%60)
+
+        self.player_names = list()
+        self.realm = ""
+        self.map = ""
+        self.file_time = None
+        self.date = None
+        self.utc_date = None
+        self.attributes = list()
+        self.speed = ""
+        self.category = ""
+        self.is_ladder = False
+        self.is_private = False
+        self.max_frame = None
+        self.type = ""
+        self.observers = list()
+        self.players = list()
+        self.people = list()
+        self.person = PersonDict()
+        self.teams = defaultdict(list)
+        self.archive_stats = dict()
+        self.stats = None
         
 class Attribute(object):
+    __slots__ = ('header', 'id', 'player', 'value', 'name')
     
     def __init__(self, data):
         #Unpack the data values and add a default name of unknown to be
@@ -115,12 +179,14 @@ class Attribute(object):
         return "%s: %s" % (self.name, self.value)
     
 class Message(object):
+    __slots__ = ('time', 'sender_id', 'target', 'text', 'sender')
     
     def __init__(self, time, pid, target, text):
         self.time, self.sender_id, self.target, self.text = time, pid, target, text
-        self.seconds = time/16
-        self.sent_to_all = (self.target == 0)
-        self.sent_to_allies = (self.target == 2)
+
+    seconds = property(lambda self: self.time/16)
+    sent_to_all = property(lambda self: self.target == 0)
+    sent_to_allies = property(lambda self: self.target == 2)
         
     def __str__(self):
         time = ((self.time/16)/60, (self.time/16)%60)
@@ -192,39 +258,47 @@ class Player(Person):
         
 class Event(object):
     name = 'BaseEvent'
+    __slots__ = ('frame', 'pid', 'type', 'code', 'player')
     def apply(self): pass
     
     """Abstract Event Type, should not be directly instanciated"""
     def __init__(self, timestamp, player_id, event_type, event_code):
         self.frame = timestamp
-        self.second = timestamp >> 4
         self.type = event_type
         self.code = event_code
-        self.is_local = (player_id != 16)
         self.pid = player_id
 
-        self.is_init = (event_type == 0x00)
-        self.is_player_action = (event_type == 0x01)
-        self.is_camera_movement = (event_type == 0x03)
-        self.is_unknown = (event_type == 0x02 or event_type == 0x04 or event_type == 0x05)
+    #Derived from the header on access to keep events small
+    second = property(lambda self: self.frame >> 4)
+    is_local = property(lambda self: self.pid != 16)
+    is_init = property(lambda self: self.type == 0x00)
+    is_player_action = property(lambda self: self.type == 0x01)
+    is_camera_movement = property(lambda self: self.type == 0x03)
+    is_unknown = property(lambda self: self.type in (0x02, 0x04, 0x05))
         
 class UnknownEvent(Event):
     name = 'UnknownEvent'
+    __slots__ = ()
     
 class PlayerJoinEvent(Event):
 	name = 'PlayerJoin'
+	__slots__ = ()
 	
 class GameStartEvent(Event):
     name = 'GameStart'
+    __slots__ = ()
     
 class PlayerLeaveEvent(Event):
 	name = 'PlayerLeave'
+	__slots__ = ()
     
 class CameraMovementEvent(Event):
     name = 'CameraMovement'
+    __slots__ = ()
     
 class ResourceTransferEvent(Event):
     name = 'ResourceTransfer'
+    __slots__ = ('sender', 'reciever', 'minerals', 'vespene')
     def __init__(self, frames, pid, type, code, target, minerals, vespene):
         super(ResourceTransferEvent, self).__init__(frames, pid, type, code)
         self.sender = pid
@@ -234,6 +308,7 @@ class ResourceTransferEvent(Event):
         
 class AbilityEvent(Event):
     name = 'AbilityEvent'
+    __slots__ = ('ability',)
     def __init__(self, framestamp, player, type, code, ability):
         super(AbilityEvent, self).__init__(framestamp, player, type, code)
         self.ability = ability
@@ -261,6 +336,7 @@ class AbilityEvent(Event):
         
 class TargetAbilityEvent(AbilityEvent):
     name = 'TargetAbilityEvent'
+    __slots__ = ('target',)
     def __init__(self, framestamp, player, type, code, ability, target):
         super(TargetAbilityEvent, self).__init__(framestamp, player, type, code, ability)
         self.target = target
@@ -293,12 +369,14 @@ class TargetAbilityEvent(AbilityEvent):
 
 class LocationAbilityEvent(AbilityEvent):
     name = 'LocationAbilityEvent'
+    __slots__ = ('location',)
     def __init__(self, framestamp, player, type, code, ability, location):
         super(LocationAbilityEvent, self).__init__(framestamp, player, type, code, ability)
         self.location = location
 
 class HotkeyEvent(Event):
     name = 'HotkeyEvent'
+    __slots__ = ('hotkey', 'overlay')
     def __init__(self, framestamp, player, type, code, hotkey, overlay=None):
         super(HotkeyEvent, self).__init__(framestamp, player, type, code)
         self.hotkey = hotkey
@@ -306,6 +384,7 @@ class HotkeyEvent(Event):
 
 class SetToHotkeyEvent(HotkeyEvent):
     name = 'SetToHotkeyEvent'
+    __slots__ = ()
     def apply(self):
         hotkey = self.player.get_hotkey(self.hotkey)
         selection = self.player.get_selection()
@@ -317,6 +396,7 @@ class SetToHotkeyEvent(HotkeyEvent):
 
 class AddToHotkeyEvent(HotkeyEvent):
     name = 'AddToHotkeyEvent'
+    __slots__ = ()
     def apply(self):
         hotkey = self.player.get_hotkey(self.hotkey)
         hotkeyed = hotkey.current[:]
@@ -335,6 +415,7 @@ class AddToHotkeyEvent(HotkeyEvent):
 
 class GetHotkeyEvent(HotkeyEvent):
     name = 'GetHotkeyEvent'
+    __slots__ = ()
     def apply(self):
         hotkey = self.player.get_hotkey(self.hotkey)
         hotkeyed = hotkey.current[:]
@@ -351,6 +432,7 @@ class GetHotkeyEvent(HotkeyEvent):
             
 class SelectionEvent(Event):
     name = 'SelectionEvent'
+    __slots__ = ('bank', 'objects', 'deselect')
     
     def __init__(self, framestamp, player, type, code, bank, objects, deselect):
         super(SelectionEvent, self).__init__(framestamp, player, type, code)
@@ -383,3 +465,68 @@ class SelectionEvent(Event):
                 print "Unknown object type (%s) at frame %s" % (hex(obj_type),self.frame)
         
         selection[self.frame] = selected
+
+class LazyField(object):
+    """ Payload attribute of a lazy event, decoded on first access """
+    def __init__(self, slot):
+        self.slot = slot
+
+    def __get__(self, event, cls):
+        if event is None:
+            return self
+        try:
+            return self.slot.__get__(event, cls)
+        except AttributeError:
+            event.decode()
+            return self.slot.__get__(event, cls)
+
+    def __set__(self, event, value):
+        self.slot.__set__(event, value)
+
+class LazyEvent(object):
+    """ Mixin for events read with lazy payloads, see GameEventsBase. The
+        payload holds the reader, parser and buffer position needed to parse
+        the event again once one of its payload_fields is used. """
+    __slots__ = ()
+
+    def __init__(self, frames, pid, type, code, payload):
+        Event.__init__(self, frames, pid, type, code)
+        self.payload = payload
+
+    def decode(self):
+        reader, parser, buffer, code, cursor, bit_shift, last_byte = self.payload
+        event = parser(reader, buffer.fork(cursor, bit_shift, last_byte), self.frame, self.type, code, self.pid)
+        for name in self.payload_fields:
+            #Keep any field that was assigned before decoding
+            try:
+                self.__class__.__dict__[name].slot.__get__(self)
+            except AttributeError:
+                setattr(self, name, getattr(event, name))
+        self.payload = None
+
+    def __reduce__(self):
+        #Pickle as the decoded event, the reader and buffer stay behind
+        state = dict()
+        for name in Event.__slots__+self.payload_fields:
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        return (_decoded_event, (self.__class__.__bases__[1], state))
+
+def _decoded_event(cls, state):
+    event = cls.__new__(cls)
+    for name, value in state.iteritems():
+        setattr(event, name, value)
+    return event
+
+def _lazy_event(cls):
+    fields = tuple(name for base in reversed(cls.__mro__) if issubclass(base, Event) and base is not Event
+                        for name in base.__dict__.get('__slots__', ()))
+    dct = dict(__slots__=('payload',), payload_fields=fields, __module__=__name__)
+    for name in fields:
+        dct[name] = LazyField(getattr(cls, name))
+    return type('Lazy'+cls.__name__, (LazyEvent, cls), dct)
+
+LAZY_EVENTS = dict((cls, _lazy_event(cls)) for cls in (AbilityEvent, TargetAbilityEvent,
+        LocationAbilityEvent, SelectionEvent, SetToHotkeyEvent, AddToHotkeyEvent, GetHotkeyEvent))
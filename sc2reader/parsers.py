@@ -1,7 +1,7 @@
 from itertools import chain
 
 from sc2reader.objects import *
-from sc2reader.utils import BIG_ENDIAN,LITTLE_ENDIAN
+from sc2reader.utils import BIG_ENDIAN,LITTLE_ENDIAN,SelectionFilter
 
 class SetupParser(object):
     def parse_join_event(self, buffer, frames, type, code, pid):
@@ -9,10 +9,17 @@ class SetupParser(object):
         
     def parse_start_event(self, buffer, frames, type, code, pid):
         return GameStartEvent(frames, pid, type, code)
+
+    #Skips are used in place of parsers for filtered events, see GameEventsBase
+    def skip_join_event(self, buffer, frames, type, code, pid): pass
+    def skip_start_event(self, buffer, frames, type, code, pid): pass
         
 class ActionParser(object):
     def parse_leave_event(self, buffer, frames, type, code, pid):
         return PlayerLeaveEvent(frames, pid, type, code)
+
+    def skip_leave_event(self, buffer, frames, type, code, pid): pass
+    def skip_transfer_event(self, buffer, frames, type, code, pid): buffer.skip(17)
     
     def parse_ability_event(self, buffer, frames, type, code, pid):
         """ Unit ability"""
@@ -66,6 +73,40 @@ class ActionParser(object):
             buffer.skip(10)
             return TargetAbilityEvent(frames, pid, type, code, ability, target)
         
+    #Scans skip over the payload of lazy events and return their class and code
+    def scan_ability_event(self, buffer, frames, type, code, pid):
+        flag = buffer.read_byte()
+        atype = buffer.read_byte()
+
+        if atype & 0x20: # command card
+            buffer.skip(2)
+            if flag in (0x29, 0x19): # cancels
+                buffer.skip(5)
+                return AbilityEvent, code
+
+            ability_flags = buffer.shift(6)
+            if ability_flags & 0x10:
+                buffer.read_bits(40)
+                buffer.skip(4)
+                return LocationAbilityEvent, code
+            elif ability_flags & 0x20:
+                code = buffer.read_short()
+                buffer.skip(16)
+                return TargetAbilityEvent, code
+            elif ability_flags & 0x30 == 0x00:
+                return AbilityEvent, code
+
+        elif atype & 0x40: # location/move
+            buffer.read_bits(40)
+            buffer.skip(5)
+            return LocationAbilityEvent, code
+
+        elif atype & 0x80: # right-click on target?
+            buffer.skip(18)
+            return TargetAbilityEvent, code
+
+        return None, code
+
     def parse_selection_event(self, buffer, frames, type, code, pid):
         bank = code >> 4
         first = buffer.read_byte() # TODO ?
@@ -73,13 +114,13 @@ class ActionParser(object):
         deselect_flag = buffer.shift(2)
         if deselect_flag == 0x01: # deselect deselect mask
             mask = buffer.read_bitmask()
-            deselect = lambda a: Selection.mask(a, mask)
+            deselect = SelectionFilter('mask', mask)
         elif deselect_flag == 0x02: # deselect mask
             indexes = [buffer.read_byte() for i in range(buffer.read_byte())]
-            deselect = lambda a: Selection.deselect(a, indexes)
+            deselect = SelectionFilter('deselect', indexes)
         elif deselect_flag == 0x03: # replace mask
             indexes = [buffer.read_byte() for i in range(buffer.read_byte())]
-            deselect = lambda a: Selection.replace(a, indexes)
+            deselect = SelectionFilter('replace', indexes)
         else:
             deselect = None
             
@@ -94,19 +135,32 @@ class ActionParser(object):
 
         return SelectionEvent(frames, pid, type, code, bank, objects, deselect)
         
+    def scan_selection_event(self, buffer, frames, type, code, pid):
+        buffer.skip(1)
+        deselect_flag = buffer.shift(2)
+        if deselect_flag == 0x01:
+            buffer.read_bits(buffer.read_byte())
+        elif deselect_flag in (0x02, 0x03):
+            buffer.skip(buffer.read_byte())
+
+        #Object types are 3 bytes and a count, object ids are 4 bytes
+        buffer.skip(buffer.read_byte()*4)
+        buffer.skip(buffer.read_byte()*4)
+        return SelectionEvent, code
+
     def parse_hotkey_event(self, buffer, frames, type, code, pid):
         hotkey = code >> 4
         action, mode = buffer.shift(2), buffer.shift(2)
         
         if mode == 1: # deselect overlay mask
             mask = buffer.read_bitmask()
-            overlay = lambda a: Selection.mask(a, mask)
+            overlay = SelectionFilter('mask', mask)
         elif mode == 2: # deselect mask
             indexes = [buffer.read_byte() for i in range(buffer.read_byte())]
-            overlay = lambda a: Selection.deselect(a, indexes)
+            overlay = SelectionFilter('deselect', indexes)
         elif mode == 3: # replace mask
             indexes = [buffer.read_byte() for i in range(buffer.read_byte())]
-            overlay = lambda a: Selection.replace(a, indexes)
+            overlay = SelectionFilter('replace', indexes)
         else:
             overlay = None
             
@@ -117,6 +171,14 @@ class ActionParser(object):
         elif action == 2:
             return GetHotkeyEvent(frames, pid, type, code, hotkey, overlay)
             
+    def scan_hotkey_event(self, buffer, frames, type, code, pid):
+        action, mode = buffer.shift(2), buffer.shift(2)
+        if mode == 1:
+            buffer.read_bits(buffer.read_byte())
+        elif mode in (2, 3):
+            buffer.skip(buffer.read_byte())
+        return (SetToHotkeyEvent, AddToHotkeyEvent, GetHotkeyEvent, None)[action], code
+
     def parse_transfer_event(self, buffer, frames, type, code, pid):
         def read_resource(buffer):
             block = buffer.read_int(BIG_ENDIAN)
@@ -142,6 +204,10 @@ class Unknown2Parser(object):
     def parse_020E_event(self, buffer, frames, type, code, pid):
         buffer.skip(4)
         return UnknownEvent(frames, pid, type, code)
+
+    def skip_0206_event(self, buffer, frames, type, code, pid): buffer.skip(8)
+    def skip_0207_event(self, buffer, frames, type, code, pid): buffer.skip(4)
+    def skip_020E_event(self, buffer, frames, type, code, pid): buffer.skip(4)
         
 class CameraParser(object):
     def parse_camera87_event(self, buffer, frames, type, code, pid):
@@ -157,6 +223,14 @@ class CameraParser(object):
         return CameraMovementEvent(frames, pid, type, code)
         
     def parse_cameraX1_event(self, buffer, frames, type, code, pid):
+        self.skip_cameraX1_event(buffer, frames, type, code, pid)
+        return CameraMovementEvent(frames, pid, type, code)
+
+    def skip_camera87_event(self, buffer, frames, type, code, pid): buffer.skip(8)
+    def skip_camera08_event(self, buffer, frames, type, code, pid):
+        buffer.skip( (buffer.read_short(BIG_ENDIAN) & 0x0F) << 3 )
+    def skip_camera18_event(self, buffer, frames, type, code, pid): buffer.skip(162)
+    def skip_cameraX1_event(self, buffer, frames, type, code, pid):
         #Get the X and Y,  last byte is also a flag
         buffer.skip(3)
         flag = buffer.read_byte()
@@ -169,8 +243,6 @@ class CameraParser(object):
             flag = buffer.read_byte()
         if flag & 0x40 != 0:
             buffer.skip(2)
-            
-        return CameraMovementEvent(frames, pid, type, code)
         
 class Unknown4Parser(object):
     def parse_0416_event(self, buffer, frames, type, code, pid):
@@ -196,3 +268,10 @@ class Unknown4Parser(object):
     def parse_04XC_event(self, buffer, frames, type, code, pid):
         #no body
         return UnknownEvent(frames, pid, type, code)
+
+    def skip_0416_event(self, buffer, frames, type, code, pid): buffer.skip(24)
+    def skip_04C6_event(self, buffer, frames, type, code, pid): buffer.skip(16)
+    def skip_0487_event(self, buffer, frames, type, code, pid): buffer.skip(4)
+    def skip_0400_event(self, buffer, frames, type, code, pid): buffer.skip(10)
+    def skip_04X2_event(self, buffer, frames, type, code, pid): buffer.skip(2)
+    def skip_04XC_event(self, buffer, frames, type, code, pid): pass
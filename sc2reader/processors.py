@@ -1,6 +1,9 @@
+from array import array
 from collections import defaultdict
 from sc2reader.objects import *
-from sc2reader.utils import key_in_bases
+from sc2reader.rates import ActionRates
+from sc2reader.store import PartitionedEvents
+from sc2reader.utils import key_in_bases, null_stage
 
 #####################################################
 # Metaclass used to help enforce the usage contract
@@ -22,11 +25,22 @@ class MetaProcessor(type):
 class Processor(object):
     required_readers = []
     required_processors = []
+
+    # Replay attributes set by the processor, used to load lazy replays and
+    # plan projections. Attributes set on items are named like players[*].result
+    provides = []
+
+    # Event type codes (0x00-0x07) passed to on_event, None for all events.
+    # See process_events.
+    event_types = None
     __metaclass__ = MetaProcessor
     
 #####################################################
 
 class PeopleProcessor(Processor):
+    required_readers = ['replay.initData','replay.details']
+    provides = ['observers','people','person']
+
     def process(self, replay):
         obs_players = list(replay.player_names)
         for player in replay.players:
@@ -44,6 +58,12 @@ class PeopleProcessor(Processor):
 #####################################################
 
 class AttributeProcessor(Processor):
+    required_readers = ['replay.attributes.events']
+    required_processors = [PeopleProcessor]
+    provides = ['speed','category','is_ladder','is_private','type',
+                'players[*].color_text','players[*].team','players[*].choosen_race',
+                'players[*].difficulty','players[*].type']
+
     def process(self, replay):
         data = defaultdict(dict)
         for attr in replay.attributes:
@@ -74,6 +94,10 @@ class AttributeProcessor(Processor):
 #####################################################
 
 class RecorderProcessor(Processor):
+    required_readers = ['replay.message.events']
+    required_processors = [PeopleProcessor]
+    provides = ['recorder']
+
     def process(self, replay):
         recorders = list(replay.people)
         for person in list(replay.people):
@@ -89,6 +113,10 @@ class RecorderProcessor(Processor):
 #####################################################
 
 class MessageProcessor(Processor):
+    required_readers = ['replay.message.events']
+    required_processors = [PeopleProcessor]
+    provides = ['messages[*].sender']
+
     def process(self, replay):
         for message in replay.messages:
             try:
@@ -103,6 +131,10 @@ class MessageProcessor(Processor):
 #####################################################
     
 class TeamsProcessor(Processor):
+    required_readers = ['replay.details']
+    required_processors = [AttributeProcessor]
+    provides = ['teams']
+
     def process(self, replay):
         for player in replay.players:
             replay.teams[player.team].append(player)
@@ -112,73 +144,151 @@ class TeamsProcessor(Processor):
 #####################################################
 
 class EventProcessor(Processor):
+    required_readers = ['replay.game.events']
+    required_processors = [PeopleProcessor]
+    provides = ['events_by_type','objects','players[*].events']
+
     def process(self, replay):
+        if not isinstance(replay.events, PartitionedEvents):
+            replay.events = PartitionedEvents(replay.events)
+        return process_events(replay, [self])
+
+    def on_start(self, replay):
         replay.events_by_type = defaultdict(list)
-        for event in replay.events:
-            if event.is_local:
-                person = replay.person[event.pid]
-                event.player = person
-                person.events.append(event)
-                
-            event.apply()
-            replay.events_by_type[event.name].append(event)    
 
+        #PersonDict lookups are slow, use a plain dict for every event
+        self.people = dict((person.pid, person) for person in replay.people)
+
+        #Streamed events aren't kept on the replay or its people
+        self.events_by_type = None
+        if isinstance(replay.events, PartitionedEvents):
+            self.events_by_type = replay.events_by_type
+
+            #The partitions become the people's events as they are
+            for pid, events in replay.events.partitions.iteritems():
+                if pid != 16:
+                    self.people[pid].events = events
+
+    #Events affect shared objects, they must be applied in frame order
+    def on_event(self, replay, event):
+        if event.pid != 16:
+            event.player = self.people[event.pid]
+        self.apply(replay, event)
+        if self.events_by_type != None:
+            self.events_by_type[event.name].append(event)
+
+    def on_finish(self, replay):
         return replay
 
+    def apply(self, replay, event):
+        #Events after a tolerant read resynced may not make sense, report
+        #them with the read failures instead of losing the whole replay
+        try:
+            event.apply()
+        except Exception, e:
+            if not getattr(replay, 'diagnostics', None):
+                raise
+            replay.diagnostics.append(dict(frame=event.frame, pid=event.pid, type=event.type,
+                    code=event.code, error="%s: %s" % (e.__class__.__name__, e)))
+
 #####################################################
 
 class ApmProcessor(Processor):
+    required_readers = ['replay.game.events']
+    required_processors = [EventProcessor]
+    provides = ['players[*].avg_apm','players[*].aps','players[*].apm','players[*].rates']
+
     def process(self, replay):
+        return process_events(replay, [self])
+
+    def on_start(self, replay):
         # Set up needed variables
         for player in replay.players:
             player.avg_apm = 0
             player.aps = dict() # Doesn't contain seconds with zero actions
             player.apm = dict() # Doesn't contain minutes with zero actions
-        # Gather data
-        for event in replay.events:
-            if event.is_local and event.is_player_action:
-                person = event.player
-                if not person.is_observer:
-                    # Calculate APS, APM and average
-                    if event.second in person.aps:
-                        person.aps[event.second] += 1
-                    else:
-                        person.aps[event.second] = 1
-                        
-                    minute = event.second/60
-                    if minute in person.apm:
-                        person.apm[minute] += 1
-                    else:
-                        person.apm[minute] = 1
-                        
-                    person.avg_apm += 1
-
-        # Average the APM for actual players
+            player.last_second = None
+
+        #Observers and global events are left out by pid. Action frames and
+        #kinds are counted all at once by ActionRates when finished
+        self.players = dict((player.pid, player) for player in replay.players if not player.is_observer)
+        self.actions = dict((pid, (array('I'), array('B'))) for pid in self.players)
+        self.kinds = dict()
+
+        #Kept events are taken from the players' partitions when finished,
+        #without a hook for every event
+        self.partitioned = isinstance(replay.events, PartitionedEvents)
+        self.event_types = () if self.partitioned else None
+
+    def on_event(self, replay, event):
+        person = self.players.get(event.pid)
+        if person == None:
+            return
+
+        person.last_second = event.frame >> 4
+        if event.type == 0x01:
+            frames, kinds = self.actions[event.pid]
+            frames.append(event.frame)
+            kinds.append(self.kinds.setdefault(event.name, len(self.kinds)))
+
+    def on_finish(self, replay):
+        if self.partitioned:
+            for pid, person in self.players.iteritems():
+                if person.events:
+                    person.last_second = person.events[-1].frame >> 4
+                actions = [event for event in person.events if event.type == 0x01]
+                frames, kinds = self.actions[pid]
+                frames.extend([event.frame for event in actions])
+                kinds.extend([self.kinds.setdefault(event.name, len(self.kinds)) for event in actions])
+
+        names = sorted(self.kinds, key=self.kinds.get)
         for player in replay.players:
-            player.avg_apm /= player.events[-1].second/60.0
+            frames, kinds = self.actions.get(player.pid, ((), ()))
+            player.rates = ActionRates(frames, kinds, names)
+            player.aps = player.rates.counts(16)
+            player.apm = player.rates.counts(16*60)
+
+            #Players can leave, or a tolerant read can stop, before a second passes
+            player.avg_apm = 0
+            if player.last_second:
+                player.avg_apm = len(player.rates)/(player.last_second/60.0)
             
         return replay
 
 #####################################################
 
 class ResultsProcessor(Processor):
+    required_processors = [TeamsProcessor,RecorderProcessor,EventProcessor]
+    provides = ['results','winner_known','players[*].result']
+    event_types = (0x01,) # PlayerLeave is an action
+
     def process(self, replay):
+        self.on_start(replay)
+        for event in replay.events_by_type['PlayerLeave']:
+            self.on_event(replay, event)
+        return self.on_finish(replay)
+
+    def on_start(self, replay):
         #Remove players from the teams as they drop out of the game   
         print replay.teams
         print replay.players
         replay.results = dict([team, len(players)] for team, players in replay.teams.iteritems())
         
         print replay.results
-        
-        for event in replay.events_by_type['PlayerLeave']:
+
+    def on_event(self, replay, event):
+        if isinstance(event, PlayerLeaveEvent):
             #Some observer actions seem to be recorded, they aren't on teams anyway
             #Their pid will always be higher than the players
             print "Player %s has left" % event.pid
             if event.pid <= len(replay.players):
                 team = replay.person[event.pid].team
                 replay.results[team] -= 1 
-                
+
+    def on_finish(self, replay):
         print replay.results
+        truncated = replay.max_frame != None and replay.max_frame < replay.frames
+
         #mark all teams with no players left as losing, save the rest of the teams
         remaining = set()
         for team, count in replay.results.iteritems():
@@ -193,8 +303,9 @@ class ResultsProcessor(Processor):
         
         #Because you can also end the game by destroying all buildings, games
         #with 1 player teams can't be known unless all other players leave
-        #we also can't do this if replay.recorder is unknown
-        elif replay.type != 'FFA' and replay.type != '1v1' and replay.recorder:
+        #we also can't do this if replay.recorder is unknown or if the events
+        #were cut short by Config.max_frame before the recorder left
+        elif replay.type != 'FFA' and replay.type != '1v1' and replay.recorder and not truncated:
             #The other results are unknown except in the (common) case that the
             #recorder is the last one on his team to leave. In this case, the
             #result for his team can be known
@@ -222,3 +333,81 @@ class ResultsProcessor(Processor):
             player.result = replay.results[player.team]
             
         return replay
+
+#####################################################
+
+def process_stream(replay, processors, store=None, stats=None):
+    """ Runs the processors over a replay whose events are a stream from
+        GameEventsBase.stream with process_events. Each event is discarded
+        once every hook has seen it. Other processors see an empty
+        replay.events list.
+
+        With an EventStore, each event is stored as it passes through and
+        the store becomes replay.events.
+    """
+    stage = null_stage if stats == None else stats.stage
+    if store != None:
+        events, replay.events = store.record(replay.events), store
+    else:
+        events, replay.events = replay.events, list()
+    replay = process_events(replay, processors, events, stats)
+
+    #Nobody consumed the stream but the store still needs to be filled
+    if store != None:
+        with stage('process EventStore', replay):
+            for event in events: pass
+
+    return replay
+
+def process_events(replay, processors, events=None, stats=None):
+    """ Runs the processors over the events, replay.events by default.
+        Consecutive processors with on_event hooks share a single pass
+        over the events; other processors run as usual. on_event is only
+        called for events whose type is in the processor's event_types,
+        which on_start can change, and the pass is skipped if no hooks are
+        left.
+
+        A stream of events can only be passed over once so processors with
+        on_event hooks must be adjacent.
+
+        Each processor, or group sharing a pass, is a stage of the stats.
+    """
+    stage = null_stage if stats == None else stats.stage
+    consumed = False
+
+    index = 0
+    while index < len(processors):
+        consumers = list()
+        while index < len(processors) and hasattr(processors[index], 'on_event'):
+            consumers.append(processors[index])
+            index += 1
+
+        if not consumers:
+            with stage('process %s' % processors[index].__class__.__name__, replay):
+                replay = processors[index].process(replay)
+            index += 1
+            continue
+
+        if events == None:
+            events = replay.events
+        elif consumed:
+            raise ValueError("Event stream already consumed; processors with on_event hooks must be adjacent")
+
+        with stage('process %s' % '+'.join(consumer.__class__.__name__ for consumer in consumers), replay):
+            #Hooks by event type, collected after on_start has set up the replay
+            hooks = [list() for type in range(8)]
+            for consumer in consumers:
+                consumer.on_start(replay)
+                for type in (range(8) if consumer.event_types == None else consumer.event_types):
+                    hooks[type].append(consumer.on_event)
+
+            if any(hooks):
+                for event in events:
+                    for hook in hooks[event.type]:
+                        hook(replay, event)
+
+            for consumer in consumers:
+                replay = consumer.on_finish(replay)
+        consumed = consumed or (any(hooks) and iter(events) is events)
+
+    return replay
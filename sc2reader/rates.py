@@ -0,0 +1,79 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class ActionRates(object):
+    """ The actions of one player as frames, for counting them over time.
+
+        frames holds the frame of each action in order and kinds indexes
+        the names list with the name of the event for each action. Counts
+        are found with numpy.bincount when numpy is available and with a
+        plain loop otherwise. Windows are in frames, 16 per game second::
+
+            player.rates.histogram(16*30)          # actions every 30 seconds
+            player.rates.sliding(16*60, step=16)   # trailing minute, every second
+            player.rates.breakdown(16*60)          # by event name, every minute
+
+        The ApmProcessor sets player.rates for every player.
+    """
+
+    def __init__(self, frames=(), kinds=(), names=()):
+        self.frames = array('I', frames)
+        self.kinds = array('B', kinds)
+        self.names = list(names)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def histogram(self, window=16, name=None):
+        """ Returns the number of actions in each window: item i counts the
+            actions in frames [i*window, (i+1)*window) up to the window of
+            the last action. With name, only actions from events of that
+            name are counted. """
+        size = max(self.frames)/window+1 if self.frames else 0
+        if name != None and name not in self.names:
+            return [0]*size
+
+        if numpy != None:
+            frames = numpy.frombuffer(self.frames, dtype=numpy.dtype(self.frames.typecode))
+            if name != None:
+                kinds = numpy.frombuffer(self.kinds, dtype=numpy.uint8)
+                frames = frames[kinds == self.names.index(name)]
+            return numpy.bincount(frames // window, minlength=size).tolist()
+
+        frames = self.frames
+        if name != None:
+            kind = self.names.index(name)
+            frames = [frame for frame, action in zip(self.frames, self.kinds) if action == kind]
+        counts = [0]*size
+        for frame in frames:
+            counts[frame/window] += 1
+        return counts
+
+    def sliding(self, window=960, step=16, name=None):
+        """ Returns the number of actions in the trailing window at every
+            step: item i counts the actions in the window frames that end
+            at (i+1)*step. window must be a multiple of step. """
+        if window % step:
+            raise ValueError("Window of %s frames is not a multiple of the %s frame step" % (window, step))
+        counts, steps = self.histogram(step, name), window/step
+
+        if numpy != None:
+            totals = numpy.cumsum([0]+counts)
+            return (totals[1:] - totals[numpy.maximum(numpy.arange(1, len(totals))-steps, 0)]).tolist()
+
+        totals = [0]
+        for count in counts:
+            totals.append(totals[-1]+count)
+        return [totals[i] - totals[max(i-steps, 0)] for i in xrange(1, len(totals))]
+
+    def breakdown(self, window=960):
+        """ Returns the histogram of the actions from each event name """
+        return dict((name, self.histogram(window, name)) for name in self.names)
+
+    def counts(self, window=16):
+        """ Returns the histogram as a dict, leaving out empty windows """
+        return dict((index, count) for index, count in enumerate(self.histogram(window)) if count)
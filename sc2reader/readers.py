@@ -1,7 +1,9 @@
 from datetime import datetime
+from sys import maxint
 
 from sc2reader.parsers import *
 from sc2reader.objects import *
+from sc2reader.store import PartitionedEvents
 from sc2reader.utils import LITTLE_ENDIAN, BIG_ENDIAN
 from sc2reader.utils import key_in_bases, timestamp_from_windows_time
 
@@ -24,15 +26,24 @@ class MetaReader(type):
 
 class Reader(object):
     __metaclass__ = MetaReader
+
+    # Replay attributes set by the reader, used to load lazy replays
+    provides = []
+
+    # Builds read, from the first up to but not including the last. Plans
+    # are compiled for ranges of builds, see config.BuildPlans; readers
+    # overriding reads instead are asked about every build.
+    builds = (0, maxint)
+
+    def reads(self, build):
+        return self.builds[0] <= build < self.builds[1]
 		
 #################################################
 
 class ReplayInitDataReader(Reader):
     file = 'replay.initData'
+    provides = ['player_names','realm']
 
-    def reads(self, build):
-        return True
-        
     def read(self, buffer, replay):
         
         # Game clients
@@ -59,8 +70,8 @@ class ReplayInitDataReader(Reader):
 
 class AttributeEventsReader(Reader):
     file = 'replay.attributes.events'
-    def reads(self, build):
-        return build < 17326
+    provides = ['attributes']
+    builds = (0, 17326)
         
     def read(self, buffer, replay):
         self.load_header(replay, buffer)
@@ -78,8 +89,7 @@ class AttributeEventsReader(Reader):
         buffer.read_chars(4)
 
 class AttributeEventsReader_17326(AttributeEventsReader):
-    def reads(self, build):
-        return build >= 17326
+    builds = (17326, maxint)
 
     def load_header(self, replay, buffer):
         buffer.read_chars(5)
@@ -88,9 +98,7 @@ class AttributeEventsReader_17326(AttributeEventsReader):
 
 class ReplayDetailsReader(Reader):
     file = 'replay.details'
-
-    def reads(self, build):
-        return True
+    provides = ['players','map','file_time','date','utc_date']
     
     def read(self, buffer, replay):
         data = buffer.read_data_struct()
@@ -145,9 +153,7 @@ class ReplayDetailsReader(Reader):
 
 class MessageEventsReader(Reader):
     file = 'replay.message.events'
-
-    def reads(self, build):
-        return True
+    provides = ['messages','other_people']
     
     def read(self, buffer, replay):
         replay.messages, time = list(), 0
@@ -185,38 +191,238 @@ class MessageEventsReader(Reader):
 
 class GameEventsBase(Reader):
     file = 'replay.game.events'
-    def reads(self, build): return False
+    provides = ['events']
+    builds = (0, 0)
     
+    #Parser lookups for each event type, indexed by the type code
+    PARSER_LOOKUPS = ('get_setup_parser', 'get_action_parser', 'get_unknown2_parser',
+                      'get_camera_parser', 'get_unknown4_parser')
+
+    #Event classes each parser can return, used to filter events at parse time
+    PARSER_EVENTS = {
+        'parse_join_event': (PlayerJoinEvent,),
+        'parse_start_event': (GameStartEvent,),
+        'parse_leave_event': (PlayerLeaveEvent,),
+        'parse_ability_event': (AbilityEvent, LocationAbilityEvent, TargetAbilityEvent),
+        'parse_selection_event': (SelectionEvent,),
+        'parse_hotkey_event': (SetToHotkeyEvent, AddToHotkeyEvent, GetHotkeyEvent),
+        'parse_transfer_event': (ResourceTransferEvent,),
+        'parse_camera87_event': (CameraMovementEvent,),
+        'parse_camera08_event': (CameraMovementEvent,),
+        'parse_camera18_event': (CameraMovementEvent,),
+        'parse_cameraX1_event': (CameraMovementEvent,),
+    }
+
+    #Bounds on tolerant reads: resyncs per replay, bytes scanned for each
+    #resync, events that must parse cleanly at a plausible boundary and
+    #the largest gap in frames allowed between them
+    RESYNC_LIMIT = 8
+    RESYNC_SCAN = 512
+    RESYNC_EVENTS = 4
+    RESYNC_GAP = 16*60
+
+    def __init__(self, keep=None, lazy_payloads=False, tolerant=False):
+        """ keep is an optional collection of Event classes and event type
+            codes (0x00-0x04). Events that match none of them are skipped
+            over without being created and never reach replay.events.
+
+            With lazy_payloads, ability, selection and hotkey payloads are
+            skipped over and only parsed when one of their fields is first
+            used. Lazy events keep the replay.game.events buffer alive until
+            they are decoded or pickled.
+
+            A tolerant reader records events it can't parse in the replay
+            diagnostics and resumes at the next plausible event boundary,
+            keeping the events read so far if no boundary can be found. """
+        self.keep = keep
+        self.lazy_payloads = lazy_payloads
+        self.tolerant = tolerant
+
     def read(self, buffer, replay):
-        replay.events, frames = list(), 0
-        
-        PARSERS = {
-            0x00: self.get_setup_parser,
-            0x01: self.get_action_parser,
-            0x02: self.get_unknown2_parser,
-            0x03: self.get_camera_parser,
-            0x04: self.get_unknown4_parser
-        }
-        
+        replay.events = PartitionedEvents(self.stream(buffer, replay))
+
+    def stream(self, buffer, replay=None):
+        """ Yields the events in the buffer one at a time as they are parsed,
+            stopping at the first event after replay.max_frame. Tolerant
+            readers append failures to replay.diagnostics. """
+        frames, table, resyncs = 0, self.get_dispatch_table(), 0
+        max_frame = getattr(replay, 'max_frame', None)
+        if max_frame == None:
+            max_frame = float('inf')
+
+        pids = None
+        if self.tolerant:
+            diagnostics = getattr(replay, 'diagnostics', list())
+            pids = self.get_pids(replay)
+
         while not buffer.empty:
             #Save the start so we can trace for debug purposes
-            #start = buffer.cursor
+            start, previous = buffer.cursor, frames
+
+            try:
+                frames += buffer.read_timestamp()
+                if frames > max_frame:
+                    break
+                pid = buffer.shift(5)
+                type, code = buffer.shift(3), buffer.read_byte()
+                if pids != None and pid not in pids:
+                    raise ValueError("Unknown player: %s" % pid)
+
+                event = table[type][code](self, buffer, frames, type, code, pid)
+                buffer.align()
+            except Exception, e:
+                if not self.tolerant:
+                    raise
+
+                resync = None
+                if resyncs < self.RESYNC_LIMIT:
+                    resync = self.resync(buffer, start, table, pids)
+                    resyncs += 1
+                diagnostics.append(self.diagnose(buffer, start, previous, e, resync))
+                if resync == None:
+                    break
+
+                #Drop the timestamp of the failed event, it can't be trusted
+                frames = previous
+                buffer.align()
+                buffer.seek(resync)
+                continue
 
-            frames += buffer.read_timestamp()
-            pid = buffer.shift(5)
-            type, code = buffer.shift(3), buffer.read_byte()
-            
-            parser = PARSERS[type](code)
-            
-            if parser == None:
-                msg = "Unknown event: %s - %s at %s"
-                raise TypeError(msg % (hex(type), hex(code), hex(start)))
-            
-            event = parser(buffer, frames, type, code, pid)
-            buffer.align()
             #event.bytes = buffer.read_range(start,buffer.cursor)
-            replay.events.append(event)
+            if event is not None:
+                yield event
+
+    def get_pids(self, replay):
+        """ Player ids expected in the events: everyone in the replay and 16
+            for global events, or 0-16 if the people aren't known yet """
+        names = getattr(replay, 'player_names', None)
+        if not names:
+            return set(range(17))
+        return set(range(1, len(names)+1)+[16])
+
+    def diagnose(self, buffer, start, frames, error, resync):
+        """ Describes an event that failed to parse for the replay diagnostics """
+        probe = buffer.fork(start)
+        try:
+            probe.read_timestamp()
+            pid = probe.shift(5)
+            type, code = probe.shift(3), probe.read_byte()
+        except EOFError:
+            pid = type = code = None
+
+        return dict(offset=start, frame=frames, pid=pid, type=type, code=code, resync=resync,
+                    error="%s: %s" % (error.__class__.__name__, error),
+                    bytes=buffer.read_range(max(start-16, 0), start+32).encode('hex'))
+
+    def resync(self, buffer, start, table, pids):
+        """ Returns the offset of the next plausible event boundary within
+            RESYNC_SCAN bytes after start or None if there isn't one """
+        for offset in xrange(start+1, min(start+self.RESYNC_SCAN, buffer.length)):
+            if self.plausible(buffer.fork(offset), table, pids):
+                return offset
+        return None
+
+    def plausible(self, probe, table, pids):
+        """ A boundary is plausible if the next RESYNC_EVENTS events, or all
+            of those left, have known players and parsers, parse without
+            errors and are no more than RESYNC_GAP frames apart """
+        unknown = GameEventsBase.parse_unknown_event.im_func
+        for count in range(self.RESYNC_EVENTS):
+            if probe.empty:
+                return True
+            try:
+                gap = probe.read_timestamp()
+                pid = probe.shift(5)
+                type, code = probe.shift(3), probe.read_byte()
+                parser = table[type][code]
+                if gap > self.RESYNC_GAP or pid not in pids or parser is unknown:
+                    return False
+                parser(self, probe, 0, type, code, pid)
+                probe.align()
+            except Exception:
+                return False
+        return True
+
+    def get_dispatch_table(self):
+        """ Returns an 8x256 table of parse functions indexed by [type][code].
+            The table is built from the get_*_parser lookups once per reader
+            class; codes without a parser map to parse_unknown_event. With
+            lazy_payloads set, parsers with a scan_* function are wrapped to
+            create lazy events, and with keep set, filtered entries are
+            swapped for their skip_* functions, once per reader. """
+        if '_dispatch' in self.__dict__:
+            return self._dispatch
+
+        cls = self.__class__
+        if '_dispatch' not in cls.__dict__:
+            table = list()
+            for type in range(8):
+                row = [GameEventsBase.parse_unknown_event.im_func]*256
+                if type < len(self.PARSER_LOOKUPS):
+                    lookup = getattr(self, self.PARSER_LOOKUPS[type])
+                    for code in range(256):
+                        parser = lookup(code)
+                        if parser != None:
+                            row[code] = parser.im_func
+                table.append(tuple(row))
+            cls._dispatch = tuple(table)
+
+        if self.keep == None and not self.lazy_payloads:
+            return cls._dispatch
 
+        table = cls._dispatch
+        if self.lazy_payloads:
+            table = [tuple(self.lazy_parser(parser) for parser in row) for row in table]
+
+        if self.keep != None:
+            keep_types = set(item for item in self.keep if isinstance(item, int))
+            keep_classes = tuple(item for item in self.keep if not isinstance(item, int))
+            table = [row if type in keep_types else tuple(self.filter_parser(parser, keep_classes) for parser in row)
+                        for type, row in enumerate(table)]
+
+        self._dispatch = tuple(table)
+        return self._dispatch
+
+    def lazy_parser(self, parser):
+        scan = getattr(self.__class__, 'scan'+parser.__name__[5:], None)
+        if scan == None:
+            return parser
+
+        scan = scan.im_func
+        def lazy(self, buffer, frames, type, code, pid):
+            payload = (self, parser, buffer, code, buffer.cursor, buffer.bit_shift, buffer.last_byte)
+            cls, code = scan(self, buffer, frames, type, code, pid)
+            if cls != None:
+                return LAZY_EVENTS[cls](frames, pid, type, code, payload)
+
+        #Filters look up the events and skips by the parser name
+        lazy.__name__ = parser.__name__
+        return lazy
+
+    def filter_parser(self, parser, keep_classes):
+        if parser is GameEventsBase.parse_unknown_event.im_func:
+            return parser
+
+        events = self.PARSER_EVENTS.get(parser.__name__, (UnknownEvent,))
+        kept = [issubclass(event, keep_classes) for event in events]
+        if all(kept):
+            return parser
+
+        elif not any(kept):
+            skip = getattr(self.__class__, 'skip'+parser.__name__[5:], None)
+            if skip != None:
+                return skip.im_func
+
+        #Variable length events without a skip still need to be parsed
+        def filtered(self, buffer, frames, type, code, pid):
+            event = parser(self, buffer, frames, type, code, pid)
+            if isinstance(event, keep_classes):
+                return event
+        return filtered
+
+    def parse_unknown_event(self, buffer, frames, type, code, pid):
+        msg = "Unknown event: %s - %s at %s"
+        raise TypeError(msg % (hex(type), hex(code), hex(buffer.cursor)))
 
     def get_setup_parser(self, code):
         if   code in (0x0B,0x0C): return self.parse_join_event
@@ -249,6 +455,4 @@ class GameEventsBase(Reader):
         elif code & 0x0F == 0x0C: return self.parse_04XC_event
         
 class GameEventsReader(GameEventsBase,Unknown2Parser,Unknown4Parser,ActionParser,SetupParser,CameraParser):
-
-    def reads(self, build):
-        return True
+    builds = (0, maxint)
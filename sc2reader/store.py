@@ -0,0 +1,229 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from itertools import izip
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from sc2reader.objects import *
+
+class EventStore(object):
+    """ Game events stored as parallel typed arrays instead of Event objects.
+
+        Each event is a row in the frame, pid, type, code, kind and ability
+        columns. kind indexes the kinds list of Event classes, and offset
+        points into the side table for the payload of that kind: pairs in
+        locations for LocationAbilityEvents, (id, type) pairs in targets
+        for TargetAbilityEvents, rows of selections for SelectionEvents and
+        rows of payloads for hotkey and resource transfer events. Selected
+        objects are stored flat in selected as (id, type) pairs.
+
+        Indexing or iterating over the store creates Event objects on demand.
+        Events are stored as parsed, before any processor has applied them.
+        Use select to find events without creating them::
+
+            for index in replay.events.select(pid=2, cls=AbilityEvent, start=0, end=960):
+                event = replay.events[index]
+
+        Enable it for replays by setting the event_store attribute of a Config.
+    """
+
+    def __init__(self, events=()):
+        self.frame = array('I')
+        self.pid = array('B')
+        self.type = array('B')
+        self.code = array('H') # target abilities overwrite the code with a short
+        self.kind = array('B')
+        self.ability = array('l') # -1 when the event has no ability
+        self.offset = array('l')  # -1 when the event has no payload
+        self.kinds = list()
+
+        #Side tables
+        self.locations = array('d')
+        self.targets = array('I')
+        self.selected = array('I')
+        self.selections = list()
+        self.payloads = list()
+
+        self._kind_index = dict()
+        for event in events:
+            self.append(event)
+
+    def append(self, event):
+        cls = event.__class__
+        if cls not in self._kind_index:
+            self._kind_index[cls] = len(self.kinds)
+            self.kinds.append(cls)
+
+        ability, offset = -1, -1
+        if isinstance(event, AbilityEvent):
+            if event.ability != None:
+                ability = event.ability
+            if isinstance(event, LocationAbilityEvent):
+                offset = len(self.locations)/2
+                self.locations.extend(event.location)
+            elif isinstance(event, TargetAbilityEvent):
+                offset = len(self.targets)/2
+                self.targets.extend(event.target)
+
+        elif isinstance(event, SelectionEvent):
+            offset, start = len(self.selections), len(self.selected)
+            for obj_id, obj_type in event.objects:
+                self.selected.append(obj_id)
+                self.selected.append(obj_type)
+            self.selections.append((event.bank, event.deselect, start, len(self.selected)))
+
+        elif isinstance(event, HotkeyEvent):
+            offset = len(self.payloads)
+            self.payloads.append((event.hotkey, event.overlay))
+
+        elif isinstance(event, ResourceTransferEvent):
+            offset = len(self.payloads)
+            self.payloads.append((event.reciever, event.minerals, event.vespene))
+
+        self.frame.append(event.frame)
+        self.pid.append(event.pid)
+        self.type.append(event.type)
+        self.code.append(event.code)
+        self.kind.append(self._kind_index[cls])
+        self.ability.append(ability)
+        self.offset.append(offset)
+
+    def record(self, events):
+        """ Yields the events, appending each one as it passes through """
+        for event in events:
+            self.append(event)
+            yield event
+
+    def select(self, pid=None, cls=None, start=None, end=None):
+        """ Returns the indexes of the events of player pid that are instances
+            of cls, between frames start and end inclusive. Frames are found
+            with bisect and the other columns are filtered with numpy when
+            it is available. """
+        low = 0 if start == None else bisect_left(self.frame, start)
+        high = len(self) if end == None else bisect_right(self.frame, end)
+        kinds = None
+        if cls != None:
+            kinds = [kind for kind, event_class in enumerate(self.kinds) if issubclass(event_class, cls)]
+
+        if low >= high:
+            return list()
+
+        if numpy != None:
+            mask = numpy.ones(high-low, dtype=bool)
+            if pid != None:
+                mask &= numpy.frombuffer(self.pid, dtype=numpy.uint8)[low:high] == pid
+            if kinds != None:
+                mask &= numpy.in1d(numpy.frombuffer(self.kind, dtype=numpy.uint8)[low:high], kinds)
+            return (numpy.flatnonzero(mask)+low).tolist()
+
+        pids, kind_column = self.pid, self.kind
+        kinds = None if kinds == None else set(kinds)
+        return [index for index in xrange(low, high)
+                    if (pid == None or pids[index] == pid)
+                    and (kinds == None or kind_column[index] in kinds)]
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+
+        cls, offset = self.kinds[self.kind[index]], self.offset[index]
+        #Unsigned int columns give longs, keep the events as parsed
+        args = [int(self.frame[index]), self.pid[index], self.type[index], self.code[index]]
+        if issubclass(cls, AbilityEvent):
+            ability = self.ability[index]
+            args.append(None if ability == -1 else ability)
+            if issubclass(cls, LocationAbilityEvent):
+                args.append(tuple(self.locations[offset*2:offset*2+2]))
+            elif issubclass(cls, TargetAbilityEvent):
+                args.append(tuple(map(int, self.targets[offset*2:offset*2+2])))
+
+        elif issubclass(cls, SelectionEvent):
+            bank, deselect, start, stop = self.selections[offset]
+            objects = zip(map(int, self.selected[start:stop:2]), map(int, self.selected[start+1:stop:2]))
+            args.extend([bank, objects, deselect])
+
+        elif offset != -1:
+            args.extend(self.payloads[offset])
+
+        return cls(*args)
+
+
+class PartitionedEvents(object):
+    """ Game events partitioned by pid as they are read.
+
+        partitions maps each pid to the list of its events in frame order,
+        which the EventProcessor hands to the person as person.events, and
+        indexes holds the position of each of those events in the replay.
+        Iterating gives every event in frame order with a k-way merge of
+        the partitions; indexing or taking the length of the whole replay
+        builds the merged list once and keeps it::
+
+            for event in replay.events.partitions.get(2, []):
+                ...
+    """
+
+    def __init__(self, events=()):
+        self.partitions = dict()
+        self.indexes = dict()
+        self._length = 0
+        self._merged = None
+        self.extend(events)
+
+    def append(self, event):
+        self.extend((event,))
+
+    def extend(self, events):
+        partitions, indexes, index = self.partitions, self.indexes, self._length
+        for event in events:
+            pid = event.pid
+            if pid not in partitions:
+                partitions[pid], indexes[pid] = list(), array('l')
+            partitions[pid].append(event)
+            indexes[pid].append(index)
+            index += 1
+        self._length = index
+        self._merged = None
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        if self._merged != None:
+            return iter(self._merged)
+        streams = [izip(self.indexes[pid], events) for pid, events in self.partitions.iteritems()]
+        return (event for index, event in merge(*streams))
+
+    def __getitem__(self, index):
+        if self._merged == None:
+            #Placing each event at its index is cheaper than merging
+            merged = [None]*self._length
+            for pid, events in self.partitions.iteritems():
+                for position, event in izip(self.indexes[pid], events):
+                    merged[position] = event
+            self._merged = merged
+        return self._merged[index]
+
+    def __getstate__(self):
+        #The merged list is rebuilt on demand
+        state = self.__dict__.copy()
+        state['_merged'] = None
+        return state
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
@@ -1,15 +1,249 @@
+import os
 from cStringIO import StringIO
 from os import SEEK_CUR, SEEK_END, SEEK_SET
 import struct
+import time
+from contextlib import contextmanager
 from itertools import groupby
+from bisect import bisect_left, bisect_right
+
+from mpyq import MPQArchive
 
 LITTLE_ENDIAN,BIG_ENDIAN = '<','>'
-    
+
+class ReplayArchive(MPQArchive):
+    """ MPQArchive over an already open replay file so that the header and
+        the archive members are read through a single file handle. The
+        (listfile) is never read so the files attribute is unavailable.
+
+        The hash and block tables are read once and each member is
+        decompressed at most once, so readers can share the archive through
+        replay.archive while the replay is being read. The stats dict maps
+        each member read to its archived and decompressed bytes and the
+        seconds spent reading and decompressing it.
+    """
+
+    def __init__(self, file):
+        file.seek(0)
+        self.file = file
+        self.header = self.read_header()
+        self.hash_table = self.read_table('hash')
+        self.block_table = self.read_table('block')
+        self.files = None
+        self.members = dict()
+        self.stats = dict()
+
+    def read_file(self, filename):
+        if filename not in self.members:
+            start = time.time()
+            data = MPQArchive.read_file(self, filename)
+            self.stats[filename] = dict(
+                    archived=self.archived_size(filename),
+                    size=len(data),
+                    time=time.time()-start,
+                )
+            self.members[filename] = data
+        return self.members[filename]
+
+    def archived_size(self, filename):
+        """ Returns the compressed size of the member in the archive """
+        return self.block_table[self.get_hash_table_entry(filename).block_table_index].archived_size
+
+
+class ReadStats(object):
+    """ Costs of each stage of reading a replay, kept as replay.stats when
+        the Config enables stats. stages lists (name, record) pairs in the
+        order the stages finished. Each record has the wall and cpu seconds
+        of the stage, the bytes it took in (archived bytes when
+        decompressing, file bytes when reading and 0 otherwise) and the
+        number of objects it added to the replay's events, messages,
+        attributes, people and objects. Every hook is called as
+        hook(name, record) when a stage finishes, to feed other metrics
+        systems.
+
+        Stages are named 'archive', 'decompress <file>', 'read <file>' and
+        'process <Processor>'. Processors sharing a pass over the events are
+        one stage named after all of them. Streamed game events are parsed
+        during that pass instead of their read stage.
+    """
+
+    def __init__(self, hooks=()):
+        self.stages = list()
+        self.hooks = list(hooks)
+
+    @contextmanager
+    def stage(self, name, replay=None, bytes=0):
+        objects = count_objects(replay)
+        wall, cpu = time.time(), sum(os.times()[:2])
+        yield
+        record = dict(
+                wall=time.time()-wall,
+                cpu=sum(os.times()[:2])-cpu,
+                bytes=bytes,
+                objects=count_objects(replay)-objects,
+            )
+        self.stages.append((name, record))
+        for hook in self.hooks:
+            hook(name, record)
+
+    def __getstate__(self):
+        #Hooks belong to the reading process, don't cache or send them
+        return dict(stages=self.stages, hooks=list())
+
+    def totals(self):
+        """ Returns the sum of each record field over all the stages """
+        totals = dict(wall=0, cpu=0, bytes=0, objects=0)
+        for name, record in self.stages:
+            for field in totals:
+                totals[field] += record[field]
+        return totals
+
+@contextmanager
+def null_stage(name, replay=None, bytes=0):
+    """ Stands in for ReadStats.stage when stats are disabled """
+    yield
+
+def count_objects(replay):
+    count = 0
+    for name in ('events','messages','attributes','people','objects'):
+        #Streamed events have no length
+        if hasattr(getattr(replay, name, None), '__len__'):
+            count += len(getattr(replay, name))
+    return count
+
+def is_filename(location):
+    """ Strings holding replay contents start with the MPQ header magic """
+    return isinstance(location,basestring) and location[:4] != 'MPQ\x1b'
+
+class LazyLoader(object):
+    """ Loads the sections of a lazy replay on first access. Each reader and
+        processor provides a set of replay attributes which are removed from
+        the replay until one of them is requested. Then only that reader or
+        processor runs, after those it requires, and any processors which
+        require a newly read file follow so that the section is complete.
+
+        The source is kept to re-open the archive: filenames are opened for
+        each section loaded while file objects and contents are held on to.
+        Like read_file, the archive is shared through replay.archive while
+        the section loads.
+    """
+
+    def __init__(self, replay, source, config):
+        self.source = source
+        self.archive = None
+        self.readers = dict()
+        self.processors = list(config.processors)
+        self.loaded, self.active = set(), set()
+
+        self.providers = dict()
+        for file, reader in config.plan_for(replay.build).readers:
+            self.readers[file] = reader
+            for name in reader.provides:
+                self.providers[name] = reader
+
+        for processor in self.processors:
+            for name in processor.provides:
+                self.providers[name] = processor
+
+        #Hold back the defaults until the provider runs
+        self.defaults = dict()
+        for name in self.providers:
+            if name in replay.__dict__:
+                self.defaults[name] = replay.__dict__.pop(name)
+
+    def load(self, replay, name):
+        """ Loads the section providing name; False if there is none """
+        provider = self.providers.get(name, None)
+        if provider is None:
+            return False
+        elif self.active:
+            #Requested while reading another section, the archive is open
+            self.run(replay, provider)
+            return True
+
+        with self.open_archive(replay):
+            self.run(replay, provider)
+
+            #Complete the sections with the processors of each file read
+            complete = False
+            while not complete:
+                complete = True
+                for processor in list(self.processors):
+                    if self.loaded.intersection(processor.required_readers):
+                        self.process(replay, processor)
+                        complete = False
+        return True
+
+    def run(self, replay, provider):
+        if provider in self.readers.values():
+            self.read(replay, provider.file)
+        else:
+            self.process(replay, provider)
+
+    def read(self, replay, file):
+        if file in self.loaded or file in self.active or file not in self.readers:
+            return
+
+        self.active.add(file)
+        reader = self.readers[file]
+        self.restore(replay, reader.provides)
+        reader.read(ReplayBuffer(self.archive.read_file(file)), replay)
+        self.active.remove(file)
+        self.loaded.add(file)
+
+    def process(self, replay, processor):
+        if processor not in self.processors or processor in self.active:
+            return
+
+        self.active.add(processor)
+        for file in processor.required_readers:
+            self.read(replay, file)
+        for required in processor.required_processors:
+            for other in list(self.processors):
+                if isinstance(other, required):
+                    self.process(replay, other)
+
+        self.restore(replay, processor.provides)
+        processor.process(replay)
+        self.processors.remove(processor)
+        self.active.remove(processor)
+
+    def restore(self, replay, names):
+        for name in names:
+            if name in self.defaults:
+                replay.__dict__[name] = self.defaults.pop(name)
+
+    @contextmanager
+    def open_archive(self, replay):
+        if is_filename(self.source):
+            with open(self.source, 'rb') as replay_file:
+                self.archive = ReplayArchive(replay_file)
+                with self.share_archive(replay):
+                    yield
+                self.archive = None
+        else:
+            if self.archive is None:
+                source = self.source if hasattr(self.source,'read') else StringIO(self.source)
+                self.archive = ReplayArchive(source)
+            with self.share_archive(replay):
+                yield
+
+    @contextmanager
+    def share_archive(self, replay):
+        replay.archive = self.archive
+        try:
+            yield
+        finally:
+            del replay.archive
+            replay.archive_stats.update(self.archive.stats)
+            self.archive.members.clear()
+
 class ReplayBuffer(object):
-    """ The ReplayBuffer is a wrapper over the cStringIO object and provides
-        convenience functions for reading structured data from Stacraft II
-        replay files. These convenience functions can be sorted into several
-        different categories providing an interface as follows:
+    """ The ReplayBuffer reads from an in memory copy of a replay file with
+        an integer cursor and provides convenience functions for reading
+        structured data from Stacraft II replay files. These convenience
+        functions can be sorted into several different categories providing
+        an interface as follows:
         
         Stream Manipulation::
             tell(self)
@@ -17,6 +251,7 @@ class ReplayBuffer(object):
             reset(self)
             align(self)
             seek(self, position, mode=SEEK_CUR)
+            fork(self, cursor, bit_shift=0, last_byte=None)
             
         Data Retrival::
             read_variable_int(self)
@@ -39,6 +274,7 @@ class ReplayBuffer(object):
             
         Core Reading::
             shift(self,bits)
+            read_bits(self,count)
             read(bytes,bits)
             
         The ReplayBuffer additionally defines the following properties:
@@ -46,54 +282,63 @@ class ReplayBuffer(object):
             length
             cursor
     """
+
+    #Extra optimization stuff
+    lo_masks = [0x00, 0x01, 0x03, 0x07, 0x0F, 0x1F, 0x3F, 0x7F, 0xFF]
+    lo_masks_inv = [0x00, 0x80, 0xC0, 0xE0, 0xF0, 0xF8, 0xFC, 0xFE, 0xFF]
+    hi_masks = [0xFF ^ mask for mask in lo_masks]
+    hi_masks_inv = [0xFF ^ mask for mask in lo_masks_inv]
     
     def __init__(self, file):
-        #Accept file like objects and string objects
+        #Accept file like objects and string or buffer objects
         if hasattr(file,'read'):
-            self.io = StringIO(file.read())
-        else:
-            self.io = StringIO(file)
+            file = file.read()
+        if isinstance(file,memoryview):
+            file = file.tobytes()
 
-        # get length of stream
-        self.io.seek(0, SEEK_END)
-        self.length = self.io.tell()
-        self.io.seek(0)
+        #Strings are sliced for chars and structs, the bytearray indexes
+        #straight to ints so single bytes don't allocate a string each
+        self.raw = str(file)
+        self.data = bytearray(self.raw)
+        self.length = len(self.raw)
+        self.cursor = 0
 
         # setup shift defaults
         self.bit_shift = 0
         self.last_byte = None
-        
-        #Extra optimization stuff
-        self.lo_masks = [0x00, 0x01, 0x03, 0x07, 0x0F, 0x1F, 0x3F, 0x7F, 0xFF]
-        self.lo_masks_inv = [0x00, 0x80, 0xC0, 0xE0, 0xF0, 0xF8, 0xFC, 0xFE, 0xFF]
-        self.hi_masks = [0xFF ^ mask for mask in self.lo_masks]
-        self.hi_masks_inv = [0xFF ^ mask for mask in self.lo_masks_inv]
-        self.coord_convert = [(2**(12 - i),1.0/2**i) for i in range(1,13)]
-        
-        self.read_basic = self.io.read
+
     '''
         Additional Properties
     '''
     @property
-    def left(self): return self.length - self.io.tell()
-    @property
-    def empty(self): return self.left==0
+    def left(self): return self.length - self.cursor
     @property
-    def cursor(self): return self.io.tell()
+    def empty(self): return self.cursor >= self.length
     
     '''
         Stream manipulation functions
     '''
-    def tell(self): return self.io.tell()
+    def tell(self): return self.cursor
     def skip(self, amount): self.seek(amount, SEEK_CUR)
-    def reset(self): self.io.seek(0); self.bit_shift = 0
+    def reset(self): self.cursor = 0; self.bit_shift = 0
     def align(self): self.bit_shift=0
     def seek(self, position, mode=SEEK_SET):
-        self.io.seek(position, mode)
-        if self.io.tell()!=0 and self.bit_shift!=0:
-            self.io.seek(-1, SEEK_CUR)
-            self.last_byte = ord(self.read_basic(1))
+        if mode == SEEK_CUR:
+            position += self.cursor
+        elif mode == SEEK_END:
+            position += self.length
+        self.cursor = min(max(position, 0), self.length)
+
+        if self.cursor!=0 and self.bit_shift!=0:
+            self.last_byte = self.data[self.cursor-1]
             
+    def fork(self, cursor, bit_shift=0, last_byte=None):
+        """ Returns a new buffer over the same data at the given position """
+        buffer = ReplayBuffer.__new__(ReplayBuffer)
+        buffer.raw, buffer.data, buffer.length = self.raw, self.data, self.length
+        buffer.cursor, buffer.bit_shift, buffer.last_byte = cursor, bit_shift, last_byte
+        return buffer
+
     def peek(self, length):
         start,last,ret = self.cursor,self.last_byte,self.read_hex(length)
         self.seek(start, SEEK_SET)
@@ -106,23 +351,36 @@ class ReplayBuffer(object):
     def read_byte(self):
         """ Basic byte read """
         if self.bit_shift==0:
-            return ord(self.read_basic(1))
+            try:
+                byte = self.data[self.cursor]
+            except IndexError:
+                raise EOFError("Cannot read byte. End of buffer reached")
+            self.cursor += 1
+            return byte
         else:
-            return self.read(1)[0]
+            return self.read_bits(8)
 
     def read_int(self, endian=LITTLE_ENDIAN):
         """ int32 read """
-        chars = self.read_basic(4) if self.bit_shift==0 else self.read_chars(4)
-        return struct.unpack(endian+'I', chars)[0]
+        if self.bit_shift==0:
+            ret = struct.unpack_from(endian+'I', self.raw, self.cursor)[0]
+            self.cursor += 4
+            return ret
+        return struct.unpack(endian+'I', self.read_chars(4))[0]
         
     def read_short(self, endian=LITTLE_ENDIAN):
         """ short16 read """
-        chars = self.read_basic(2) if self.bit_shift==0 else self.read_chars(2)
-        return struct.unpack(endian+'H', chars)[0]
+        if self.bit_shift==0:
+            ret = struct.unpack_from(endian+'H', self.raw, self.cursor)[0]
+            self.cursor += 2
+            return ret
+        return struct.unpack(endian+'H', self.read_chars(2))[0]
         
     def read_chars(self, length=0):
         if self.bit_shift==0:
-            return self.read_basic(length)
+            start = self.cursor
+            self.cursor = min(start+length, self.length)
+            return self.raw[start:self.cursor]
         else:
             return ''.join(chr(byte) for byte in self.read(length))
 
@@ -216,48 +474,23 @@ class ReplayBuffer(object):
         """ Object ID is big-endian int32 """
         return self.read_int(endian=BIG_ENDIAN)
 
-    def read_coordinate(self):        
-        # Combine coordinate whole and fraction
-        def _coord_to_float(coord):
-            fraction = 0
-            for mask,quotient in self.coord_convert:
-                if (coord[1] & mask):
-                    fraction = fraction + quotient
-            return coord[0] + fraction
-        
-        # Read an x or y coordinate dimension
-        def _coord_dimension():
-            coord = self.read(bits=20)
-            return _coord_to_float([coord[0], coord[1] << 4 | coord[2],])
-        
+    def read_coordinate(self):
+        # Each dimension is 20 bits, an 8 bit whole part and 12 bit fraction
         # TODO?: Handle optional z dimension
-        return (_coord_dimension(), _coord_dimension())
+        return (self.read_bits(20)/4096.0, self.read_bits(20)/4096.0)
 
     def read_bitmask(self):
         """ Reads a bitmask given the current bitoffset """
         length = self.read_byte()
-        bytes = reversed(self.read(bits=length))
         mask = 0
-        for byte in bytes:
+        for byte in reversed(self.read(bits=length)):
             mask = (mask << 8) | byte
 
-        # Turn things like 10010011 into [True, False, False, True,...]
-        def _make_mask(byte, bit_length, current=1):
-            if current < bit_length:
-                byte_mask = (2**(bit_length-current))
-                bytes = [(byte & byte_mask) > 0,] 
-                return bytes + _make_mask(byte, bit_length, current+1)
-            else:
-                return [byte & 0x1 == 0x01,]
-
-        return list(reversed(_make_mask(mask, length)))
+        # Turn things like 10010011 into [True, True, False, False, True,...]
+        return [(mask >> bit) & 0x1 == 0x01 for bit in range(max(length,1))]
 
     def read_range(self, start, end):
-        current = self.cursor
-        self.io.seek(start)
-        ret = self.read_basic(end-start)
-        self.io.seek(current)
-        return ret
+        return self.raw[start:end]
         
     
     '''
@@ -280,7 +513,8 @@ class ReplayBuffer(object):
             #make sure there are enough bits left in the byte
             if new_shift <= 8:
                 if not bit_shift:
-                    self.last_byte = ord(self.read_basic(1))
+                    self.last_byte = self.data[self.cursor]
+                    self.cursor += 1
                 
                 #using a bit_mask_array tested out to be 20% faster, go figure
                 ret = (self.last_byte >> bit_shift) & self.lo_masks[bits]
@@ -292,88 +526,75 @@ class ReplayBuffer(object):
                 msg = "Cannot shift off %s bits. Only %s bits remaining."
                 raise ValueError(msg % (bits, 8-self.bit_shift))
                 
-        except TypeError:
+        except IndexError:
             raise EOFError("Cannot shift requested bits. End of buffer reached")
 
-    def read(self, bytes=0, bits=0):
+    def read_bits(self, count):
+        """
+        Reads count bits as an integer. Bits are taken from each byte from
+        the lowest unread bit up and the pieces taken from each byte are
+        joined with the earlier pieces as the most significant bits.
+        """
+        bit_shift = self.bit_shift
+        if bit_shift:
+            #Start with what remains of the loaded byte
+            remaining = 8-bit_shift
+            if count <= remaining:
+                self.bit_shift = 0 if count == remaining else bit_shift+count
+                return (self.last_byte >> bit_shift) & self.lo_masks[count]
+            value = self.last_byte >> bit_shift
+            count -= remaining
+        else:
+            value = 0
+
+        data, cursor = self.data, self.cursor
+        end, bits = cursor+(count >> 3), count & 0x7
         try:
-            bytes, bits = bytes+bits/8, bits%8
-            bit_count = bytes*8+bits
-            
-            #check special case of not having to do any work
-            if bit_count == 0: return []
-            
-            #check sepcial case of intra-byte read
-            if bit_count <= (8-self.bit_shift):
-                return [self.shift(bit_count)]
-            
-            #check special case of byte-aligned reads, performance booster
-            if self.bit_shift == 0:
-                base = [ord(self.read_basic(1)) for byte in range(bytes)]
-                if bits != 0:
-                    return base+[self.shift(bits)]
-                return base
-            
-            # Calculated shifts
-            old_bit_shift = self.bit_shift 
-            new_bit_shift = (self.bit_shift+bits) % 8
-            
-            # Masks
-            lo_mask = 2**old_bit_shift-1
-            lo_mask_inv = 0xFF - 2**(8-old_bit_shift)+1
-            hi_mask = 0xFF ^ lo_mask
-            hi_mask_inv = 0xFF ^ lo_mask_inv
-            
-            #last byte parameters
-            if new_bit_shift == 0: #this means we filled the last byte (8)
-                last_mask = 0xFF
-                adjustment = 8-old_bit_shift
-            else:
-                last_mask = 2**new_bit_shift-1
-                adjustment = new_bit_shift-old_bit_shift
-            
-            #Set up for the looping with a list, the bytes, and an initial part
-            raw_bytes = list()
-            prev, next = self.last_byte, ord(self.read_basic(1))
-            first = prev & hi_mask
-            bit_count -= 8-old_bit_shift
-            
-            while bit_count > 0:
-            
-                if bit_count <= 8: #this is the last byte
-                    #The bits in the last byte are included in order starting at
-                    #the new_bit_shift boundary with extra bits bumped back a byte
-                    #because we can have odd bit requests, the bit shift can change
-                    last = (next & last_mask)
-
-                    # we need to bring the first byte closer
-                    # if the adjustment is lower than 0
-                    if adjustment < 0:
-                        first = first >> abs(adjustment)
-                    
-                    raw_bytes.append(first | (last >> max(adjustment,0)))
-                    if adjustment > 0:
-                        raw_bytes.append(last & (2**adjustment-1))
-                        
-                    bit_count = 0
-                    
-                if bit_count > 8: #We can do simple wrapping for middle bytes
-                    second = (next & lo_mask_inv) >> (8-old_bit_shift)
-                    raw_bytes.append(first | second)
-                    
-                    #To remain consistent, always shfit these bits into the hi_mask
-                    first = (next & hi_mask_inv) << old_bit_shift
-                    bit_count -= 8
-                    
-                    #Cycle down to the next byte
-                    prev,next = next,ord(self.read_basic(1))
-            
-            self.last_byte = next
-            self.bit_shift = new_bit_shift
-            return raw_bytes
-            
-        except TypeError:
-            raise EOFError("Cannot read requested bits/bytes. End of buffer reached")
+            if end > self.length:
+                raise IndexError
+            for position in xrange(cursor, end):
+                value = (value << 8) | data[position]
+
+            if bits:
+                self.last_byte = data[end]
+                value = (value << bits) | (self.last_byte & self.lo_masks[bits])
+                end += 1
+        except IndexError:
+            raise EOFError("Cannot read requested bits. End of buffer reached")
+
+        self.cursor = end
+        self.bit_shift = bits
+        return value
+
+    def read(self, bytes=0, bits=0):
+        """
+        Reads the bytes and bits as a list of byte values with any extra bits
+        in a final, right aligned, value. Prefer read_bits where an integer
+        is wanted.
+        """
+        bit_count = bytes*8+bits
+        if bit_count == 0:
+            return []
+
+        #check special case of byte-aligned reads, performance booster
+        if self.bit_shift == 0 and bit_count & 0x7 == 0:
+            start, end = self.cursor, self.cursor+(bit_count >> 3)
+            if end > self.length:
+                raise EOFError("Cannot read requested bytes. End of buffer reached")
+            self.cursor = end
+            return list(self.data[start:end])
+
+        value = self.read_bits(bit_count)
+        extra = bit_count & 0x7
+        raw_bytes = list()
+        if extra:
+            raw_bytes.append(value & self.lo_masks[extra])
+            value >>= extra
+        for byte in range(bit_count >> 3):
+            raw_bytes.append(value & 0xFF)
+            value >>= 8
+        raw_bytes.reverse()
+        return raw_bytes
             
 class PersonDict(dict):
     """Delete is supported on the pid index only"""
@@ -405,13 +626,25 @@ class PersonDict(dict):
             
         super(PersonDict, self).__setitem__(value.pid, value)
 
+    def __reduce__(self):
+        # Restore the contents directly on unpickle; __setitem__ needs fully
+        # built Person objects which may not exist yet in a cyclic replay
+        return (self.__class__, (), (self.__dict__, dict(self)))
+
+    def __setstate__(self, state):
+        self.__dict__.update(state[0])
+        dict.update(self, state[1])
+
 
 
 class TimeDict(dict):
-    """ Dict with frames as key """
+    """ Dict with frames as key. Keys must be assigned in increasing order
+        and are kept in a sorted list so that looking up a frame without an
+        entry finds the latest earlier entry with bisect. """
 
     def __init__(self, *args, **kwargs):
         dict.__init__(self, *args, **kwargs)
+        self._keys = sorted(dict.keys(self))
         self.current = None
         self.current_key = None
 
@@ -421,20 +654,44 @@ class TimeDict(dict):
         try:
             return dict.__getitem__(self, key)
         except KeyError:
-            stamps = filter(lambda x: x<=key, sorted(self.keys()))
-            if stamps:
-                return dict.__getitem__(self, stamps[-1])
+            index = bisect_right(self._keys, key)
+            if index:
+                return dict.__getitem__(self, self._keys[index-1])
             else:
                 return self.current
 
     def __setitem__(self, key, value):
         if self.current_key is not None and key < self.current_key:
-            raise ValueError("Cannot assign before last item (%s)" % (max(self.keys()),))
+            raise ValueError("Cannot assign before last item (%s)" % (self._keys[-1],))
         else:
+            if key != self.current_key:
+                self._keys.append(key)
             self.current = value
             self.current_key = key
             dict.__setitem__(self, key, value)
 
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        del self._keys[bisect_left(self._keys, key)]
+        if key == self.current_key:
+            self.current_key = self._keys[-1] if self._keys else None
+            self.current = dict.get(self, self.current_key)
+
+    def items_between(self, start, end):
+        """ Returns the (frame, value) items from start to end inclusive """
+        keys = self._keys[bisect_left(self._keys, start):bisect_right(self._keys, end)]
+        return [(key, dict.__getitem__(self, key)) for key in keys]
+
+    def __reduce__(self):
+        # Bypass the ordering checks in __setitem__ when unpickling
+        return (self.__class__, (), (self.__dict__, dict(self)))
+
+    def __setstate__(self, state):
+        self.__dict__.update(state[0])
+        dict.update(self, state[1])
+        if '_keys' not in state[0]:
+            self._keys = sorted(state[1])
+
 
 
 class Selection(TimeDict):
@@ -472,6 +729,17 @@ class Selection(TimeDict):
     def get_types(self):
         return ', '.join([ u'%s %sx' % (name.name, len(list(objs))) for (name, objs) in groupby(self.current, lambda obj: obj.__class__)])
 
+class SelectionFilter(object):
+    """ Picklable deselect/overlay callable applying one of the Selection
+        filters (mask, deselect, replace) to a list of selected objects """
+
+    def __init__(self, method, argument):
+        self.method = method
+        self.argument = argument
+
+    def __call__(self, selection):
+        return getattr(Selection, self.method)(selection, self.argument)
+
 def timestamp_from_windows_time(windows_time):
     # This windows timestamp measures the number of 100 nanosecond periods since
     # January 1st, 1601. First we subtract the number of nanosecond periods from
@@ -8,7 +8,7 @@ import datetime
 sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),"../")))
 
 import sc2reader
-from sc2reader.exceptions import ParseError
+from sc2reader.exceptions import ParseError, ReadError
 
 # Parsing should fail for an empty file.
 def test_empty():
@@ -18,6 +18,368 @@ def test_empty():
     with pytest.raises(ValueError):
         sc2reader.read("test_replays/corrupted/empty.SC2Replay")
 
+def test_read_directory():
+    replays = sc2reader.read("test_replays/build17326", processes=2)
+    assert [replay.filename for replay in replays] == sorted(replay.filename for replay in replays)
+    assert [replay.map for replay in replays] == [sc2reader.read(replay.filename).map for replay in replays]
+
+def test_read_batch_failures():
+    filenames = ["test_replays/corrupted/empty.SC2Replay", "test_replays/build17811/2.SC2Replay"]
+    replays = sc2reader.read_batch(filenames, processes=2)
+    assert isinstance(replays[0], ReadError)
+    assert replays[0].filename == filenames[0]
+    assert replays[1].map == sc2reader.read(filenames[1]).map
+
+def test_iread():
+    replays = sc2reader.iread(["test_replays/build16561", "test_replays/corrupted/empty.SC2Replay"], processes=2)
+    assert replays.next().filename == "test_replays/build16561/UnknownEvent_0400.SC2Replay"
+    assert [replay.filename for replay in replays] == [
+            "test_replays/build16561/WeirdInitializationEvent.SC2Replay",
+            "test_replays/build16561/test.SC2Replay",
+            "test_replays/corrupted/empty.SC2Replay",
+        ]
+
+def test_read_header():
+    release, frames = sc2reader.read_header("test_replays/build17811/1.SC2Replay")
+    assert release[4] == 17811
+    assert frames == 31482
+
+def test_summary():
+    from sc2reader.config import SummaryConfig
+    summary = sc2reader.read("test_replays/build17811/1.SC2Replay", SummaryConfig())
+    assert not hasattr(summary, '__dict__')
+    assert summary.map == "Lost Temple"
+    assert summary.type == "1v1"
+    assert summary.utc_date == datetime.datetime(2011, 2, 20, 20, 44, 47)
+    assert [player.name for player in summary.teams[1]] == ["Emperor"]
+    assert summary.person['Boom'].choosen_race == "Terran"
+
+def test_cache(tmpdir):
+    from sc2reader.config import DefaultConfig
+    class CachedConfig(DefaultConfig):
+        cache = sc2reader.ReplayCache(str(tmpdir))
+
+    replay = sc2reader.read("test_replays/build17811/2.SC2Replay", CachedConfig())
+    assert len(tmpdir.listdir()) == 1
+    cached = sc2reader.read("test_replays/build17811/2.SC2Replay", CachedConfig())
+    assert cached is not replay
+    assert cached.map == replay.map
+    assert len(cached.events) == len(replay.events)
+    assert cached.person['Boom'].result == replay.person['Boom'].result
+
+    CachedConfig.cache.max_size = 0
+    CachedConfig.cache.evict()
+    assert tmpdir.listdir()[0].listdir() == []
+
+def test_in_memory():
+    with open("test_replays/build17811/1.SC2Replay", "rb") as replay_file:
+        contents = replay_file.read()
+        replay = sc2reader.read_file(replay_file)
+        assert replay.filename == "test_replays/build17811/1.SC2Replay"
+        assert replay.map == "Lost Temple"
+
+    assert sc2reader.read_header(bytearray(contents)) == sc2reader.read_header(replay_file.name)
+    for source in (contents, bytearray(contents), memoryview(contents)):
+        replay = sc2reader.read(source)
+        assert replay.filename is None
+        assert replay.map == "Lost Temple"
+        assert len(replay.events) == 11283
+
+def test_lazy():
+    from sc2reader.config import DefaultConfig
+    class LazyConfig(DefaultConfig):
+        lazy = True
+
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay", LazyConfig())
+    assert replay.length == (32, 47)
+    assert replay.map == "Lost Temple"
+    assert replay.person['Emperor'].choosen_race == "Protoss"
+    assert 'replay.game.events' not in replay._loader.loaded
+    assert 'replay.message.events' not in replay._loader.loaded
+
+    assert replay.messages[0].sender.name == "Emperor"
+    assert 'replay.game.events' not in replay._loader.loaded
+
+    assert len(replay.events) == 11283
+    assert replay.events[0].player is not None
+    assert replay.results == {1: "Won", 2: "Lost"}
+    assert replay.person['Boom'].result == "Lost"
+    assert not hasattr(replay, 'archive')
+    assert sorted(replay.archive_stats.keys()) == sorted(LazyConfig.readers.keys())
+
+def test_archive_stats():
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay")
+    assert not hasattr(replay, 'archive')
+    stats = replay.archive_stats['replay.game.events']
+    assert stats['size'] == 130589
+    assert 0 < stats['archived'] < stats['size']
+
+def test_read_bits():
+    from sc2reader.utils import ReplayBuffer
+    buffer = ReplayBuffer('\xab\xcd\xef\x12')
+    assert buffer.read_bits(4) == 0xb
+    assert buffer.read_bits(12) == 0xacd
+    assert buffer.read(bits=4) == [0xf]
+    assert buffer.read(bytes=1, bits=4) == [0xe1, 0x2]
+    assert buffer.empty
+
+def test_dispatch_table():
+    from sc2reader.readers import GameEventsReader
+    reader = GameEventsReader()
+    table = reader.get_dispatch_table()
+    assert len(table) == 8 and all(len(row) == 256 for row in table)
+    assert table[1][0x1B] is GameEventsReader.parse_ability_event.im_func
+    assert table[7][0x00] is GameEventsReader.parse_unknown_event.im_func
+    assert GameEventsReader().get_dispatch_table() is table
+
+def test_event_filter():
+    from sc2reader.config import IntegrationConfig, OrderedDict
+    from sc2reader.readers import GameEventsReader
+    from sc2reader.objects import AbilityEvent, SelectionEvent, HotkeyEvent, CameraMovementEvent
+    keep = (AbilityEvent, SelectionEvent, HotkeyEvent)
+
+    class FilteredConfig(IntegrationConfig):
+        readers = OrderedDict(IntegrationConfig.readers)
+        readers['replay.game.events'] = [GameEventsReader(keep=keep)]
+
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay", config=FilteredConfig())
+    full = sc2reader.read("test_replays/build17811/1.SC2Replay", config=sc2reader.config.IntegrationConfig())
+    expected = [(e.frame, e.pid, e.type, e.code) for e in full.events if isinstance(e, keep)]
+    assert [(e.frame, e.pid, e.type, e.code) for e in replay.events] == expected
+    assert not any(isinstance(e, CameraMovementEvent) for e in replay.events)
+
+def test_stream_events():
+    class StreamConfig(sc2reader.DefaultConfig):
+        stream_events = True
+
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay", config=StreamConfig())
+    full = sc2reader.read("test_replays/build17811/1.SC2Replay")
+    assert replay.events == [] and replay.players[0].events == []
+    assert replay.results == full.results
+    for player, expected in zip(replay.players, full.players):
+        assert player.apm == expected.apm
+        assert player.avg_apm == expected.avg_apm
+
+def test_event_store():
+    from sc2reader.objects import AbilityEvent
+    class StoreConfig(sc2reader.config.IntegrationConfig):
+        event_store = True
+
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay", config=StoreConfig())
+    full = sc2reader.read("test_replays/build17811/1.SC2Replay", config=sc2reader.config.IntegrationConfig())
+    assert len(replay.events) == len(full.events)
+    for event, expected in zip(replay.events[::50], full.events[::50]):
+        assert event.__class__ == expected.__class__
+        assert (event.frame, event.pid, event.code) == (expected.frame, expected.pid, expected.code)
+        assert getattr(event, 'ability', None) == getattr(expected, 'ability', None)
+        assert getattr(event, 'location', None) == getattr(expected, 'location', None)
+        assert getattr(event, 'objects', None) == getattr(expected, 'objects', None)
+
+    indexes = replay.events.select(pid=2, cls=AbilityEvent, start=1000, end=3000)
+    assert indexes == [i for i, e in enumerate(full.events)
+        if e.pid == 2 and isinstance(e, AbilityEvent) and 1000 <= e.frame <= 3000]
+
+def test_slots():
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay")
+    for item in (replay.events[0], replay.messages[0], replay.attributes[0], replay.objects.values()[0]):
+        assert not hasattr(item, '__dict__')
+
+    event = replay.events_by_type['AbilityEvent'][0]
+    assert event.second == event.frame >> 4
+    assert event.is_local and event.is_player_action and not event.is_camera_movement
+
+def test_lazy_payloads():
+    import cPickle
+    from sc2reader.config import IntegrationConfig, OrderedDict
+    from sc2reader.readers import GameEventsReader
+    from sc2reader.objects import SelectionEvent, LazyEvent
+
+    class LazyPayloadConfig(IntegrationConfig):
+        readers = OrderedDict(IntegrationConfig.readers)
+        readers['replay.game.events'] = [GameEventsReader(lazy_payloads=True)]
+
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay", config=LazyPayloadConfig())
+    full = sc2reader.read("test_replays/build17811/1.SC2Replay", config=IntegrationConfig())
+    selections = [(i, e) for i, e in enumerate(replay.events) if isinstance(e, SelectionEvent)]
+    index, event = selections[10]
+    assert isinstance(event, LazyEvent) and event.payload != None
+
+    copy = cPickle.loads(cPickle.dumps(event, 2))
+    assert copy.__class__ is SelectionEvent and copy.objects == full.events[index].objects
+    assert event.payload == None and event.objects == full.events[index].objects
+    for index, event in selections:
+        assert event.objects == full.events[index].objects
+
+def test_max_frame():
+    class EarlyConfig(sc2reader.DefaultConfig):
+        max_frame = 6*60*16
+
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay", config=EarlyConfig())
+    assert replay.max_frame == 6*60*16
+    assert replay.events[-1].frame <= replay.max_frame
+    assert all(max(player.apm) < 6 for player in replay.players)
+    assert replay.results == {1: 'Unknown', 2: 'Unknown'}
+
+def test_time_dict():
+    from sc2reader.utils import TimeDict
+    frames = TimeDict()
+    frames[0], frames[10], frames[20] = 'a', 'b', 'c'
+    assert (frames[5], frames[10], frames[15], frames[99]) == ('a', 'b', 'b', 'c')
+    assert frames.items_between(5, 20) == [(10, 'b'), (20, 'c')]
+    with pytest.raises(ValueError):
+        frames[15] = 'd'
+
+def test_tolerant_events():
+    from sc2reader.config import IntegrationConfig, OrderedDict
+    from sc2reader.readers import GameEventsReader
+
+    class TolerantConfig(sc2reader.DefaultConfig):
+        readers = OrderedDict(sc2reader.DefaultConfig.readers)
+        readers['replay.game.events'] = [GameEventsReader(tolerant=True)]
+
+    with pytest.raises(TypeError):
+        sc2reader.read("test_replays/build17811/footman.SC2Replay", config=IntegrationConfig())
+
+    replay = sc2reader.read("test_replays/build17811/footman.SC2Replay", config=TolerantConfig())
+    assert len(replay.events) > 100000
+    assert replay.events[-1].frame <= replay.frames
+    assert replay.diagnostics[0]['offset'] == 0x356F and replay.diagnostics[0]['resync'] != None
+    assert len([diagnostic for diagnostic in replay.diagnostics if 'resync' in diagnostic]) <= GameEventsReader.RESYNC_LIMIT+1
+
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay", config=TolerantConfig())
+    assert replay.diagnostics == []
+
+def test_partitioned_events():
+    from sc2reader.config import IntegrationConfig
+    from sc2reader.store import PartitionedEvents
+    replay = sc2reader.read("test_replays/build17811/9.SC2Replay")
+    events = list(replay.events)
+    assert isinstance(replay.events, PartitionedEvents)
+    assert [event.frame for event in events] == sorted(event.frame for event in events)
+    assert replay.events[::100] == events[::100] and replay.events[-1] is events[-1]
+    for player in replay.players:
+        assert player.events is replay.events.partitions[player.pid]
+        assert player.events == [event for event in events if event.pid == player.pid]
+
+    raw = sc2reader.read("test_replays/build17811/9.SC2Replay", config=IntegrationConfig())
+    assert [(e.frame, e.pid, e.type, e.code) for e in raw.events] == [(e.frame, e.pid, e.type, e.code) for e in events]
+
+def test_process_events():
+    from sc2reader.config import IntegrationConfig
+    from sc2reader.processors import Processor, process_events
+
+    class CountProcessor(Processor):
+        event_types = (0x03,)
+        def process(self, replay):
+            return process_events(replay, [self])
+        def on_start(self, replay):
+            self.count = 0
+        def on_event(self, replay, event):
+            self.count += 1
+        def on_finish(self, replay):
+            return replay
+
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay", config=IntegrationConfig())
+    expected = len([event for event in replay.events if event.is_camera_movement])
+    first, second = CountProcessor(), CountProcessor()
+    process_events(replay, [first, second])
+    assert first.count == second.count == expected
+    process_events(replay, [first], iter(replay.events))
+    assert first.count == expected
+    with pytest.raises(ValueError):
+        process_events(replay, [first, sc2reader.processors.TeamsProcessor(), second], iter(replay.events))
+
+def test_action_rates(monkeypatch):
+    import sc2reader.rates
+    from sc2reader.rates import ActionRates
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay")
+    for player in replay.players:
+        rates = player.rates
+        assert rates.counts(16) == player.aps and rates.counts(16*60) == player.apm
+        assert len(rates) == sum(player.apm.values())
+        histogram = rates.histogram(16*30)
+        assert sum(histogram) == len(rates)
+        assert [sum(counts) for counts in zip(*rates.breakdown(16*30).values())] == histogram
+
+        sliding = rates.sliding(16*60, step=16*30)
+        assert sliding == [sum(histogram[max(i-1, 0):i+1]) for i in range(len(histogram))]
+
+        selections = rates.histogram(16, 'SelectionEvent')
+        monkeypatch.setattr(sc2reader.rates, 'numpy', None)
+        assert rates.sliding(16*60, step=16*30) == sliding
+        assert rates.histogram(16, 'SelectionEvent') == selections
+        monkeypatch.undo()
+
+    assert ActionRates().histogram() == [] and ActionRates().sliding() == []
+    with pytest.raises(ValueError):
+        rates.sliding(100, step=16)
+
+def test_read_stats():
+    finished = list()
+    class StatsConfig(sc2reader.DefaultConfig):
+        stats = True
+        stats_hooks = [lambda name, record: finished.append(name)]
+
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay", config=StatsConfig())
+    stages = dict(replay.stats.stages)
+    assert [name for name, record in replay.stats.stages] == finished
+    assert finished[0] == 'archive' and finished[-1] == 'process EventProcessor+ApmProcessor+ResultsProcessor'
+    assert stages['decompress replay.game.events']['bytes'] == replay.archive_stats['replay.game.events']['archived']
+    assert stages['read replay.game.events']['bytes'] == replay.archive_stats['replay.game.events']['size']
+    assert stages['read replay.game.events']['objects'] == len(replay.events)
+    assert all(record['wall'] >= 0 and record['cpu'] >= 0 for record in stages.values())
+    assert replay.stats.totals()['objects'] >= len(replay.events)+len(replay.messages)
+    import cPickle
+    assert cPickle.loads(cPickle.dumps(replay.stats)).stages == replay.stats.stages
+    assert sc2reader.read("test_replays/build17811/1.SC2Replay").stats == None
+
+def test_project():
+    import cPickle
+    config = sc2reader.project(['players[*].avg_apm', 'map'])
+    assert config.readers.keys() == ['replay.initData', 'replay.details', 'replay.game.events']
+    assert [processor.__class__.__name__ for processor in config.processors] == ['PeopleProcessor', 'EventProcessor', 'ApmProcessor']
+    assert sc2reader.project(['map', 'players[*].avg_apm']).processors is config.processors
+    assert cPickle.loads(cPickle.dumps(config)).readers == config.readers
+
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay", config=config)
+    full = sc2reader.read("test_replays/build17811/1.SC2Replay")
+    assert replay.map == full.map
+    assert [player.avg_apm for player in replay.players] == [player.avg_apm for player in full.players]
+    assert sorted(replay.archive_stats) == sorted(config.readers)
+
+    replay = sc2reader.read("test_replays/build17811/1.SC2Replay", config=sc2reader.project(['players[*].result', 'frames']))
+    assert replay.results == full.results and replay.frames == full.frames
+
+    with pytest.raises(ValueError):
+        sc2reader.project(['players[*].result'], config=sc2reader.config.NoEventsConfig())
+    with pytest.raises(ValueError):
+        sc2reader.project(['events'], config=sc2reader.config.NoEventsConfig())
+    with pytest.raises(ValueError):
+        sc2reader.project(['nothing'])
+
+def test_build_plans():
+    from sc2reader.config import IntegrationConfig, OrderedDict
+    from sc2reader.readers import AttributeEventsReader, AttributeEventsReader_17326, ReplayDetailsReader
+    config = sc2reader.DefaultConfig()
+    old, new = config.plan_for(16561), config.plan_for(17811)
+    assert config.plan_for(17325) is old and config.plan_for(17326) is new
+    assert dict(old.readers)['replay.attributes.events'].__class__ is AttributeEventsReader
+    assert dict(new.readers)['replay.attributes.events'].__class__ is AttributeEventsReader_17326
+    assert [file for file, reader in new.readers] == config.readers.keys()
+    assert new.processors == config.processors
+
+    class OddDetailsReader(ReplayDetailsReader):
+        def reads(self, build):
+            return build % 2 == 1
+
+    class OddConfig(IntegrationConfig):
+        readers = OrderedDict([('replay.details', [OddDetailsReader()])])
+
+    config = OddConfig()
+    assert config.plan_for(17811) is config.plan_for(17811) and config.plan_for(17813) is not config.plan_for(17811)
+    with pytest.raises(NotImplementedError):
+        config.plan_for(17812)
+
 # Tests for build 17811 replays
 
 def test_standard_1v1():